@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 #!/usr/bin/python
-import concurrent.futures
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date, datetime, timedelta
 from enum import Enum, unique
 
@@ -13,6 +12,8 @@ from core.instances.Feature import Feature
 from core.instances.Images import Image
 from core.libs.BaseProperties import BaseProperties
 from core.libs.CustomExceptions import NoAvailableImageOnPeriod
+from core.services.SateliteImagery.AcquisitionEngine import \
+    AsyncAcquisitionEngine
 from core.services.SateliteImagery.ImageryServices import (
     BaseImageAcquisitionService, Cbers, Sentinel2)
 
@@ -57,6 +58,8 @@ class ImageAcquisition(BaseProperties):
         if not days_period:
             days_period = self.service._days_gap
         aprint(f' > Buscando Imagens Histórica e Atual\n    - Sensor: CBERS - Data máxima: {max_date} - Período: {days_period} dias')
+        # A single search covers both periods, each composition selects its images from it
+        search_days_period = 2*days_period
 
         #* Current Image acquisition
         current_image_name = f'Atual_{self.today_str}'
@@ -68,7 +71,9 @@ class ImageAcquisition(BaseProperties):
             max_cloud_coverage=max_cloud_coverage,
             compose_as_single_image=compose_as_single_image,
             output_img_name=current_image_name,
-            days_period=days_period
+            days_period=days_period,
+            search_max_date=max_date,
+            search_days_period=search_days_period
         )
 
         #* Historic Image acquisition
@@ -82,9 +87,56 @@ class ImageAcquisition(BaseProperties):
             max_cloud_coverage=max_cloud_coverage,
             compose_as_single_image=compose_as_single_image,
             output_img_name=historic_image_name,
-            days_period=days_period
+            days_period=days_period,
+            search_max_date=max_date,
+            search_days_period=search_days_period
         )
 
+    def _acquire_tiles_concurrently(self, area_of_interest: Feature) -> list:
+        results = []
+        with ThreadPoolExecutor(max_workers=self.n_cores) as executor:
+            futures = [
+                executor.submit(
+                    self.service.get_best_available_images_for_tile,
+                    tile_name=tile,
+                    area_of_interest=area_of_interest
+                ) for tile in self.intersecting_tiles
+            ]
+
+            for response in as_completed(futures):
+                results.append(response.result())
+                self.progress_tracker.report_progress(add_progress=True)
+        return results
+
+    def load_available_images(
+        self,
+        area_of_interest: Feature,
+        max_date: datetime,
+        days_period: int = None,
+        search_max_date: datetime = None,
+        search_days_period: int = None
+    ) -> None:
+        """Selects the images of the period ending at max_date, only querying the service if its last search doesn't cover the period
+            Args:
+                area_of_interest (Feature): Area of interest
+                max_date (datetime): End of the period
+                days_period (int, optional): Days of the period. Defaults to the service days gap.
+                search_max_date (datetime, optional): End of the search, when it spans more then the period. Defaults to max_date.
+                search_days_period (int, optional): Days of the search. Defaults to days_period.
+        """
+        begin_date, end_date = self.service.get_search_window(max_date=max_date, days_period=days_period)
+        if self.service.select_available_images(begin_date=begin_date, end_date=end_date):
+            return
+
+        self.service.query_available_images(
+            area_of_interest=area_of_interest,
+            max_date=search_max_date or max_date,
+            days_period=search_days_period or days_period
+        )
+        if not self.service.select_available_images(begin_date=begin_date, end_date=end_date):
+            # The search doesn't contain the period, which is then searched by itself
+            self.service.query_available_images(area_of_interest=area_of_interest, max_date=max_date, days_period=days_period)
+
     def get_composed_images_for_aoi(
         self,
         max_date: datetime,
@@ -93,7 +145,9 @@ class ImageAcquisition(BaseProperties):
         results_output_location: Database = None,
         max_cloud_coverage: int = None,
         compose_as_single_image: bool = True,
-        output_img_name: str = ''
+        output_img_name: str = '',
+        search_max_date: datetime = None,
+        search_days_period: int = None
     ) -> Image:
         if not results_output_location:
             results_output_location = self.temp_db
@@ -115,41 +169,32 @@ class ImageAcquisition(BaseProperties):
             image.date_created = max_date
             return image
 
-        self.service.query_available_images(
+        self.load_available_images(
             area_of_interest=area_of_interest,
             max_date=max_date,
-            days_period=days_period
+            days_period=days_period,
+            search_max_date=search_max_date,
+            search_days_period=search_days_period
         )
 
+        if self.acquisition_mode == 'ASYNC':
+            results = AsyncAcquisitionEngine(service=self.service, max_workers=self.n_cores).acquire(
+                tile_names=self.intersecting_tiles,
+                area_of_interest=area_of_interest,
+                on_tile_completed=lambda result: self.progress_tracker.report_progress(add_progress=True)
+            )
+        else:
+            results = self._acquire_tiles_concurrently(area_of_interest=area_of_interest)
+
         images = {}
-        futures = []
-
-        # with ProcessPoolExecutor(max_workers=self.n_cores) as executor:
-        #     for tile in self.intersecting_tiles:
-        #         futures.append(
-        #             executor.submit(
-        #                 self.service.get_best_available_images_for_tile,
-        #                 tile
-        #             )
-        #         )
-
-        #     for response in as_completed(futures):
-        #         result = response.result()
-        #         tile_images = result.get('images')
-        #         tile = result.get('tile')
-        #         if tile_images:
-        #             for tile_image in tile_images:
-        #                 images[tile_image.datetime] = [*images.get(tile_image.datetime,[]), tile_image]
-        #         self.progress_tracker.report_progress(add_progress=True)
-
-        for tile in self.intersecting_tiles:
-            result = self.service.get_best_available_images_for_tile(tile_name=tile, area_of_interest=area_of_interest)
+        for result in results:
             tile_images = result.get('images')
-            tile = result.get('tile')
             if tile_images:
                 for tile_image in tile_images:
                     images[tile_image.datetime] = [*images.get(tile_image.datetime,[]), tile_image]
-            self.progress_tracker.report_progress(add_progress=True)
+
+        # Tiles finish in any order, so the composition is rebuilt following the images dates
+        images = {image_date:images.get(image_date) for image_date in sorted(images)}
 
         composition_images = []
         [composition_images.extend(i) for i in images.values()]
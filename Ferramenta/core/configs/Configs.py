@@ -58,6 +58,54 @@ class Configs(BasePath):
             if not os.environ.get('DOWNLOAD_STORAGE'):
                 os.environ['DOWNLOAD_STORAGE'] = self.download_storage
 
+        if hasattr(self, 'download_cache_size_gb') and self.download_cache_size_gb is not None:
+            if not os.environ.get('DOWNLOAD_CACHE_SIZE_GB'):
+                os.environ['DOWNLOAD_CACHE_SIZE_GB'] = str(self.download_cache_size_gb)
+
+        if hasattr(self, 'scene_catalog_ingestion_lag_days') and self.scene_catalog_ingestion_lag_days is not None:
+            if not os.environ.get('SCENE_CATALOG_INGESTION_LAG_DAYS'):
+                os.environ['SCENE_CATALOG_INGESTION_LAG_DAYS'] = str(self.scene_catalog_ingestion_lag_days)
+
+        if hasattr(self, 'acquisition_mode') and self.acquisition_mode:
+            if not os.environ.get('ACQUISITION_MODE'):
+                os.environ['ACQUISITION_MODE'] = self.acquisition_mode
+
+        if hasattr(self, 'stretch_backend') and self.stretch_backend:
+            if not os.environ.get('STRETCH_BACKEND'):
+                os.environ['STRETCH_BACKEND'] = self.stretch_backend
+
+        if hasattr(self, 'fused_raster_pipeline') and self.fused_raster_pipeline:
+            if not os.environ.get('FUSED_RASTER_PIPELINE'):
+                os.environ['FUSED_RASTER_PIPELINE'] = 'True'
+
+        if hasattr(self, 'virtual_band_stack') and self.virtual_band_stack:
+            if not os.environ.get('VIRTUAL_BAND_STACK'):
+                os.environ['VIRTUAL_BAND_STACK'] = 'True'
+
+        if hasattr(self, 'keep_intermediate_rasters') and self.keep_intermediate_rasters:
+            if not os.environ.get('KEEP_INTERMEDIATE_RASTERS'):
+                os.environ['KEEP_INTERMEDIATE_RASTERS'] = 'True'
+
+        if hasattr(self, 'http_pool_size') and self.http_pool_size:
+            if not os.environ.get('HTTP_POOL_SIZE'):
+                os.environ['HTTP_POOL_SIZE'] = str(self.http_pool_size)
+
+        if hasattr(self, 'http_timeout_seconds') and self.http_timeout_seconds:
+            if not os.environ.get('HTTP_TIMEOUT_SECONDS'):
+                os.environ['HTTP_TIMEOUT_SECONDS'] = str(self.http_timeout_seconds)
+
+        if hasattr(self, 'download_max_rate_mbps') and self.download_max_rate_mbps is not None:
+            if not os.environ.get('DOWNLOAD_MAX_RATE_MBPS'):
+                os.environ['DOWNLOAD_MAX_RATE_MBPS'] = str(self.download_max_rate_mbps)
+
+        if hasattr(self, 'download_max_per_host') and self.download_max_per_host is not None:
+            if not os.environ.get('DOWNLOAD_MAX_PER_HOST'):
+                os.environ['DOWNLOAD_MAX_PER_HOST'] = str(self.download_max_per_host)
+
+        if hasattr(self, 'download_max_global') and self.download_max_global is not None:
+            if not os.environ.get('DOWNLOAD_MAX_GLOBAL'):
+                os.environ['DOWNLOAD_MAX_GLOBAL'] = str(self.download_max_global)
+
         if hasattr(self, 'delete_temp_files') and self.delete_temp_files:
             if not os.environ.get('DELETE_TEMP_FILES'):
                 os.environ['DELETE_TEMP_FILES'] = 'True'
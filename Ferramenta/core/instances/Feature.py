@@ -7,7 +7,7 @@ import time
 from datetime import date, datetime
 
 from arcpy import (Append_management, CopyFeatures_management, Describe,
-                   Exists, FeatureClassToFeatureClass_conversion,
+                   Exists, Extent, FeatureClassToFeatureClass_conversion,
                    FeaturesToJSON_conversion, GetCount_management, ListFields,
                    MinimumBoundingGeometry_management, Project_management,
                    RepairGeometry_management,
@@ -223,6 +223,21 @@ class Feature(BaseDBPath, CursorManager):
 
         return response
 
+    def get_extent(self, spatial_reference: SpatialReference = None) -> Extent:
+        """Extent of the feature geometries, projected on the fly to spatial_reference"""
+        xmin = ymin = xmax = ymax = None
+        for row in SearchCursor(self.full_path, ['SHAPE@'], spatial_reference=spatial_reference):
+            if not row[0]:
+                continue
+            extent = row[0].extent
+            xmin = extent.XMin if xmin is None else min(xmin, extent.XMin)
+            ymin = extent.YMin if ymin is None else min(ymin, extent.YMin)
+            xmax = extent.XMax if xmax is None else max(xmax, extent.XMax)
+            ymax = extent.YMax if ymax is None else max(ymax, extent.YMax)
+        if xmin is None:
+            return None
+        return Extent(xmin, ymin, xmax, ymax)
+
     def select_by_attributes(self, where_clause: str) -> dict:
         return SelectLayerByAttribute_management(in_layer_or_view=self.full_path, where_clause=where_clause)
 
@@ -1,29 +1,37 @@
 # -*- coding: utf-8 -*-
 #!/usr/bin/python
+import hashlib
 import os
-import urllib
 from concurrent import futures
 from concurrent.futures.thread import ThreadPoolExecutor
 from datetime import date, datetime
+from threading import Lock
 from xml.etree import ElementTree as ET
 
 from arcpy import (CreatePansharpenedRasterDataset_management, Describe,
-                   EnvManager, Exists, ProjectRaster_management,
+                   EnvManager, Exists, ProjectRaster_management, Raster,
                    SpatialReference)
 from arcpy.ia import ClassifyPixelsUsingDeepLearning
-from arcpy.management import (CompositeBands, CopyRaster, Delete,
+from arcpy.management import (Clip, CompositeBands, CopyRaster, Delete,
                               MosaicToNewRaster)
 from arcpy.sa import ExtractByMask, Stretch
 from core._constants import *
 from core._logs import *
 from core.instances.Database import Database, wrap_on_database_editing
 from core.instances.MosaicDataset import MosaicDataset
-from core.libs.Base import delete_source_files, prevent_server_error
+from core.libs.Base import (delete_source_files, prevent_server_error,
+                            serialize_geoprocessing)
 from core.libs.BaseDBPath import BaseDBPath
-from core.libs.CustomExceptions import PansharpCustomException
+from core.libs.CustomExceptions import (CircuitOpenError,
+                                        PansharpCustomException,
+                                        RequestRejectedError)
+from core.libs.Downloader import ResumableDownloader
+from core.libs.RasterPipeline import (BandStack, FusedRasterPipeline,
+                                     stretch_raster)
+from core.libs.RetryPolicy import DOWNLOAD_RETRY_POLICY
+from core.libs.SceneCatalog import SceneRecord
 from core.ml_models.ImageClassifier import BaseImageClassifier
 from sentinelsat import make_path_filter
-from sentinelsat.exceptions import ServerError as SetinelServerError
 
 from .Feature import Feature
 
@@ -33,12 +41,33 @@ class BaseSateliteImage(BaseDBPath):
     datetime: datetime = None
     date: date = None
     tileid: str = None
-    properties: dict = None
     uuid: str = ''
     cloudcoverpercentage: float = 1.0
+    area_of_interest_coverage: float = None # Percentage of the tile ∩ area of interest inside the footprint
+    record: SceneRecord = None
+
+    def _load_record(self, record: SceneRecord) -> None:
+        """Keeps only the ranking and download fields of the scene, the rest is read from the record when needed"""
+        self.record = record
+        self.uuid = record.scene_id
+        self.tileid = record.tile
+        self.datetime = record.datetime
+        self.date = record.datetime.date()
+        if record.cloud_cover is not None:
+            self.cloudcoverpercentage = record.cloud_cover
     
     def __repr__(self):
         return f'{self.tileid}_{self.date}'
+
+    @property
+    def properties(self) -> dict:
+        """Every property returned by the API for the scene, decoded on each access"""
+        return self.record.properties if self.record else {}
+
+    @property
+    def geometry(self) -> dict:
+        """Footprint GeoJSON of the scene"""
+        return self.record.footprint if self.record else None
         
     def get(self, property: str):
         return self.properties.get(property)
@@ -59,27 +88,72 @@ class BaseSateliteImage(BaseDBPath):
         """
         return self.cloudcoverpercentage
 
-    def download_image(self, *args, **kwargs) -> None:
+    def download_image(self, image_database: Database, output_name: str = '', delete_temp_files: bool = False) -> None:
         """Downloads each band on the image and composes all as one, and deletes the original download folder"""
+        self.download_bands(image_database=image_database, output_name=output_name)
+        self.compose_bands()
+
+    def download_bands(self, image_database: Database, output_name: str = '') -> None:
+        """Downloads the image bands, without composing them"""
         pass
 
+    @property
+    def band_stack(self) -> BandStack:
+        """Downloaded bands read as a single raster, when compose_bands left them uncomposed"""
+        return None
+
+    def erase_band_files(self) -> None:
+        """Removes the band files kept for the band_stack, once the composition read them"""
+        pass
+
+    def compose_band_stack(self) -> None:
+        """Composes the bands kept for the band_stack, for compositions that can't read them directly"""
+        pass
+
+    def compose_bands(self) -> None:
+        """Composes the downloaded bands as one image and deletes the original download folder"""
+        pass
+
+    @serialize_geoprocessing
+    def _erase_image_bands(self, folder: str = '') -> None:
+        if Exists(folder):
+            Delete(folder)
+
 
 class CbersImage(BaseSateliteImage):
-    def __init__(self, *args, **kwargs):
+    _band_download_workers: int = 5 # pan, red, green, blue and nir are fetched at the same time
+    downloader: ResumableDownloader = None
+    band_files: dict = None
+
+    def __init__(self, record: SceneRecord, *args, **kwargs):
         self.__dict__.update(kwargs)
         self.nodata_pixel_percentage_str = ''
-        self._split_title_data()
+        self._load_record(record)
 
-    def _split_title_data(self):
-        self.tileid = f'{self.col}_{self.row}'
-        self.datetime = datetime.strptime(self.datetime, format('%Y-%m-%dT%H:%M:%S'))
-        self.date = self.datetime.date()
+    @staticmethod
+    def split_properties(properties: dict) -> tuple:
+        """Tile and acquisition date of a scene, from the properties returned by the STAC API
+            Returns:
+                tuple: (tileid, datetime)
+        """
+        return f"{properties.get('col')}_{properties.get('row')}", datetime.strptime(properties.get('datetime'), format('%Y-%m-%dT%H:%M:%S'))
+
+    @property
+    def title(self) -> str:
+        return self.record.scene_id
+
+    def get_band_url(self, band: str) -> str:
+        return self.record.assets.get(f'{band}_url')
     
-    def download_image(self, image_database: Database, output_name: str = '', delete_temp_files: bool = False) -> None:
+    @property
+    def download_folder(self) -> str:
+        return os.path.join(self.staging_storage, self.title)
+
+    def download_bands(self, image_database: Database, output_name: str = '') -> None:
         self.path = image_database.full_path
         self.name = f'{output_name}_{self.format_date_as_str(current_date=self.date, return_format="%Y%m%d")}'
 
-        download_folder = os.path.join(self.download_storage, self.tileid)
+        download_folder = self.download_folder
         if not Exists(download_folder):
             os.makedirs(download_folder)
 
@@ -92,31 +166,41 @@ class CbersImage(BaseSateliteImage):
                 'blue_img': os.path.join(download_folder, f"b_{self.tileid}.tif"),
                 'nir_img': os.path.join(download_folder, f"n_{self.tileid}.tif")
             }
-            self._download_worker(url=self.pan_url, filepath=files.get('pan_img'))
-            self._download_worker(url=self.red_url, filepath=files.get('red_img'))
-            self._download_worker(url=self.green_url, filepath=files.get('green_img'))
-            self._download_worker(url=self.blue_url, filepath=files.get('blue_img'))
-            self._download_worker(url=self.nir_url, filepath=files.get('nir_img'))
+            urls = {
+                'pan_img': self.get_band_url('pan'),
+                'red_img': self.get_band_url('red'),
+                'green_img': self.get_band_url('green'),
+                'blue_img': self.get_band_url('blue'),
+                'nir_img': self.get_band_url('nir')
+            }
+            self.band_files = self._download_bands(urls=urls, files=files)
 
-            self._compose_image(files=files, download_folder=download_folder)
-            
-        self._erase_image_bands(download_folder)
+    def compose_bands(self) -> None:
+        if not self.exists:
+            self._compose_image(files=self.band_files, download_folder=self.download_folder)
 
+        self._erase_image_bands(self.download_folder)
 
+    @serialize_geoprocessing
     def _compose_image(self, files: dict, download_folder: str) -> None:
+        filepaths = [
+            files.get('nir_img'),
+            files.get('red_img'),
+            files.get('green_img'),
+            files.get('blue_img')
+        ]
+        if self.virtual_band_stack:
+            # The pansharpening reads the bands through an on the fly composite, no composed copy is written
+            self._pansharp_image(composed_img=BandStack(band_files=filepaths).as_raster(), pan_img=files.get('pan_img'))
+            return
+
         composed_img = f"{download_folder}\\{self.tileid}_composed.tif"
         if not Exists(composed_img):
-            filepaths = [
-                files.get('nir_img'),
-                files.get('red_img'),
-                files.get('green_img'),
-                files.get('blue_img')
-            ]
             CompositeBands(';'.join(filepaths), composed_img)
         self._pansharp_image(composed_img=composed_img, pan_img=files.get('pan_img'))
 
     @wrap_on_database_editing
-    def _pansharp_image(self, composed_img: str,  pan_img: str) -> None:
+    def _pansharp_image(self, composed_img: any,  pan_img: str) -> None:
         try:
             CreatePansharpenedRasterDataset_management(
                 in_raster=composed_img,
@@ -129,35 +213,87 @@ class CbersImage(BaseSateliteImage):
                 pansharpening_type='Gram-Schmidt'
             )
         except:
-            Delete(composed_img)
+            if isinstance(composed_img, str):
+                Delete(composed_img)
             raise PansharpCustomException(tile=self.tileid)
     
-    @prevent_server_error
+    def _download_bands(self, urls: dict, files: dict) -> dict:
+        """Downloads all bands concurrently and only returns after every band is on disk
+            Args:
+                urls (dict): Band key -> asset URL
+                files (dict): Band key -> destination file path
+            Returns:
+                dict: Band key -> path of the band file to be used (cached or downloaded)
+        """
+        with ThreadPoolExecutor(max_workers=self._band_download_workers) as executor:
+            downloads = {
+                band:executor.submit(self._fetch_band, band=band, url=urls.get(band), filepath=files.get(band))
+                for band in files
+            }
+            futures.wait(downloads.values())
+            # Re-raises any failure that exceeded the retry attempts
+            return {band:download.result() for band, download in downloads.items()}
+
+    def _fetch_band(self, band: str, url: str, filepath: str) -> str:
+        cached_band = self.scene_cache.get(scene_id=self.title, band=band)
+        if cached_band:
+            return cached_band
+        self._download_worker(url=url, filepath=filepath)
+        return self.scene_cache.put(scene_id=self.title, band=band, file=filepath)
+
+    @prevent_server_error(policy=DOWNLOAD_RETRY_POLICY)
     def _download_worker(self, url: str, filepath: str) -> None:
-        if not Exists(filepath):
-            urllib.request.urlretrieve(url, filepath)
-
-    def _erase_image_bands(self, folder: str = '') -> None:
-        if Exists(folder):
-            Delete(folder)
+        if not self.downloader:
+            self.downloader = ResumableDownloader(governor=self.download_governor)
+        # Failed attempts leave a .part file behind, which the next attempt resumes from
+        self.downloader.download(url=url, filepath=filepath)
 
 class SentinelImage(BaseSateliteImage):
-    def __init__(self, api: any, *args, **kwargs):
+    _bands: list = ['B02', 'B03', 'B04', 'B08']
+    _checksum_algorithms: dict = {'MD5': 'md5', 'SHA3-256': 'sha3_256'} # Manifest checksumName -> hashlib
+    _qi_blocks: list = ['Quality_Indicators_Info', 'Image_Content_QI']
+    _qi_chunk_size: int = 16*1024
+    downloader: ResumableDownloader = None
+    band_files: dict = None
+    qi_info: dict = None
+
+    def __init__(self, api: any, record: SceneRecord, apis: list = None, *args, **kwargs):
         self.api = api
+        self.apis = apis if apis else [api] # Every account that can serve this scene
+        self._load_record(record)
+        # Filled from the scene catalog when it already has the value
+        self.nodata_pixel_percentage_str = str(record.nodata_pixel_percentage) if record.nodata_pixel_percentage is not None else ''
         self.__dict__.update(kwargs)
-        self.nodata_pixel_percentage_str = ''
-        self._split_title_data()
 
-    def _split_title_data(self):
-        title_parts = self.title.split('_')
-        self.tileid = title_parts[5][1:]
-        self.datetime = datetime.strptime(title_parts[6], format('%Y%m%dT%H%M%S'))
-        self.date = self.datetime.date()
+    @property
+    def service_url(self) -> str:
+        return self.api.api_url
+
+    @staticmethod
+    def split_title(title: str) -> tuple:
+        """Tile and acquisition date of a scene, from its product title
+            Returns:
+                tuple: (tileid, datetime)
+        """
+        title_parts = title.split('_')
+        return title_parts[5][1:], datetime.strptime(title_parts[6], format('%Y%m%dT%H%M%S'))
+
+    @property
+    def title(self) -> str:
+        return self.record.title
+
+    @property
+    def filename(self) -> str:
+        return self.record.filename
 
     # ---- Methods for acquiring nodata_pixel_percentage data ----
     @property
     def nodata_pixel_percentage(self) -> float:
-        if not self.nodata_pixel_percentage_str: self._fetch_s2_qi_info()
+        if not self.nodata_pixel_percentage_str:
+            try:
+                self._fetch_s2_qi_info()
+            except (CircuitOpenError, RequestRejectedError):
+                return 100 # Treated as an empty image until the server is back or if it refused the request
         if self.nodata_pixel_percentage_str:
             try:
                 return float(self.nodata_pixel_percentage_str)
@@ -170,51 +306,202 @@ class SentinelImage(BaseSateliteImage):
             odata_path += f"/Nodes('{p}')"
         odata_path += "/$value"
         return odata_path
-    @prevent_server_error
+    @prevent_server_error(policy=DOWNLOAD_RETRY_POLICY)
     def _fetch_s2_qi_info(self) -> None:
         if self.api.is_online(self.uuid):
             path = f"{self.title}.SAFE/MTD_MSIL2A.xml"
             url = self._get_odata_file_url(path)
-            response = self.api.session.get(url)
-            if '504 Gateway Time-out' in str(response.content):
-                raise SetinelServerError
-            if not response.content:
-                self.nodata_pixel_percentage_str = '100'
-            else:
-                xml = ET.XML(response.content)
-                for elem in xml.find(".//Image_Content_QI"):
-                    if "." in elem.text and elem.tag == "NODATA_PIXEL_PERCENTAGE":
-                        self.nodata_pixel_percentage_str = elem.text
+            with self.api.session.get(url, stream=True) as response:
+                # Error pages aren't parsed, client errors are rejected and server errors retried by the policy
+                response.raise_for_status()
+                self.qi_info = self._parse_qi_info(chunks=response.iter_content(chunk_size=self._qi_chunk_size))
+            if self.qi_info is None:
+                self.nodata_pixel_percentage_str = '100' # Empty metadata file
+                return
+            nodata_pixel_percentage = self.qi_info.get('NODATA_PIXEL_PERCENTAGE', '')
+            if "." in nodata_pixel_percentage:
+                self.nodata_pixel_percentage_str = nodata_pixel_percentage
+
+    @classmethod
+    def _parse_qi_info(cls, chunks: any) -> dict:
+        """Incrementally parses the product metadata, stopping as soon as the Image_Content_QI block was read,
+        so the rest of the file is neither downloaded nor kept in memory
+            Args:
+                chunks (any): Iterable with the bytes of MTD_MSIL2A.xml
+            Returns:
+                dict: Quality indicator tag -> value (text), or None if the file is empty
+        """
+        parser = ET.XMLPullParser(events=('start', 'end'))
+        qi_info = {}
+        received_bytes = 0
+        quality_blocks = 0 # Depth of open Quality_Indicators_Info/Image_Content_QI elements
+        for chunk in chunks:
+            if not chunk:
+                continue
+            received_bytes += len(chunk)
+            parser.feed(chunk)
+            for event, element in parser.read_events():
+                tag = element.tag.split('}')[-1] # Namespaces vary between processing baselines
+                if tag in cls._qi_blocks:
+                    quality_blocks += 1 if event == 'start' else -1
+                    if event == 'end' and tag == 'Image_Content_QI':
+                        return qi_info
+                    continue
+                if event == 'end':
+                    if quality_blocks and len(element) == 0 and element.text and element.text.strip():
+                        qi_info[tag] = element.text.strip()
+                    element.clear()
+        return qi_info if received_bytes else None
+
+    @property
+    def cloudy_pixel_percentage(self) -> float:
+        """Cloud percentage assessed by the processing baseline, available after the QI metadata is fetched"""
+        if not self.qi_info:
+            return None
+        cloudy_pixel_percentage = self.qi_info.get('CLOUDY_PIXEL_PERCENTAGE', self.qi_info.get('Cloud_Coverage_Assessment'))
+        try:
+            return float(cloudy_pixel_percentage)
+        except (TypeError, ValueError):
+            return None
     # ---- Funções para buscar informações do nodata_pixel_percentage ----
     
-    @prevent_server_error
-    def _download(self, band: list) -> dict:
-        return self.api.download(self.uuid, directory_path=self.download_storage, checksum=False, nodefilter=make_path_filter(band))
+    @staticmethod
+    def _make_bands_filter(patterns: list) -> callable:
+        """Combines the path filters of every band, so the product nodes are listed and fetched only once"""
+        path_filters = [make_path_filter(pattern) for pattern in patterns]
+        def bands_filter(node_info: dict) -> bool:
+            return any(path_filter(node_info) for path_filter in path_filters)
+        return bands_filter
+
+    @prevent_server_error(policy=DOWNLOAD_RETRY_POLICY)
+    def _is_online(self) -> bool:
+        return self.api.is_online(self.uuid)
+
+    @prevent_server_error(policy=DOWNLOAD_RETRY_POLICY)
+    def _get_product_nodes(self, bands_filter: callable) -> list:
+        """Lists the product files accepted by bands_filter, with their size and checksum, from the product manifest"""
+        response = self.api.session.get(self._get_odata_file_url(f"{self.title}.SAFE/manifest.safe"))
+        response.raise_for_status()
+
+        nodes = []
+        for data_object in ET.XML(response.content).iter('dataObject'):
+            byte_stream = data_object.find('byteStream')
+            file_location = byte_stream.find('fileLocation') if byte_stream is not None else None
+            if file_location is None:
+                continue
 
-    def download_image(self, image_database: Database, output_name: str = '', delete_temp_files: bool = False) -> None:
+            node_path = file_location.get('href').lstrip('./')
+            if not bands_filter({'node_path': f'./{node_path}'}):
+                continue
+
+            checksum = byte_stream.find('checksum')
+            checksum_name = checksum.get('checksumName', '').upper() if checksum is not None else ''
+            nodes.append({
+                'node_path': node_path,
+                'size': int(byte_stream.get('size', 0)),
+                'checksum': checksum.text if checksum_name in self._checksum_algorithms else None,
+                'checksum_algorithm': self._checksum_algorithms.get(checksum_name, 'md5')
+            })
+        return nodes
+
+    @prevent_server_error(policy=DOWNLOAD_RETRY_POLICY)
+    def _download_node(self, node: dict) -> str:
+        """Streams a single product file, hashing it while it is written. A checksum mismatch
+        deletes the partial file and raises, so only this band is downloaded again"""
+        filepath = os.path.join(self.images_folder, *node.get('node_path').split('/'))
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        if not self.downloader:
+            self.downloader = ResumableDownloader(session=self.api.session, timeout=self.http_timeout_seconds, governor=self.download_governor)
+        return self.downloader.download(
+            url=self._get_odata_file_url(f"{self.title}.SAFE/{node.get('node_path')}"),
+            filepath=filepath,
+            checksum=node.get('checksum'),
+            checksum_algorithm=node.get('checksum_algorithm'),
+            expected_size=node.get('size') or None # The manifest size covers servers that omit Content-Length
+        )
+
+    @prevent_server_error(policy=DOWNLOAD_RETRY_POLICY)
+    def _download_offline_product(self, bands_filter: callable) -> dict:
+        # sentinelsat streams the files itself, so only the concurrency limits apply here
+        with self.download_governor.slot(self.api.api_url):
+            os.makedirs(self.staging_storage, exist_ok=True)
+            return self.api.download(self.uuid, directory_path=self.staging_storage, checksum=False, nodefilter=bands_filter)
+
+    def _download(self, bands: list) -> None:
+        bands_filter = self._make_bands_filter(bands)
+        if not self._is_online():
+            # Long Term Archive products have to be requested first, which is handled by sentinelsat
+            self._download_offline_product(bands_filter=bands_filter)
+            return
+
+        for node in self._get_product_nodes(bands_filter=bands_filter):
+            self._download_node(node=node)
+
+    @property
+    def images_folder(self) -> str:
+        return os.path.join(self.staging_storage, self.filename)
+
+    def download_bands(self, image_database: Database, output_name: str = '') -> None:
+        """Downloads B02, B03, B04 and B08 (10m) in a single request, without composing them.
+        Bands already in the scene cache are not downloaded again"""
         self.path = image_database.full_path
         self.name = f'{output_name}_{self.format_date_as_str(current_date=self.date, return_format="%Y%m%d")}'
-        
-        images_folder = os.path.join(self.download_storage, self.filename)
+
+        if self.exists:
+            return
+
+        self.band_files = {}
+        for band in self._bands:
+            cached_band = self.scene_cache.get(scene_id=self.uuid, band=band)
+            if cached_band:
+                self.band_files[band] = cached_band
+
+        missing_bands = [band for band in self._bands if band not in self.band_files]
+        if not missing_bands:
+            return
+
+        self._download(bands=[f'*_{band}_10m*' for band in missing_bands])
+        for band_file in self.get_files_by_extension(folder=self.images_folder, extension='.jp2'):
+            for band in missing_bands:
+                if f'_{band}_10m' in os.path.basename(band_file):
+                    self.band_files[band] = self.scene_cache.put(scene_id=self.uuid, band=band, file=band_file)
+
+    @property
+    def stack_bands(self) -> bool:
+        """The windowed composition reads the bands directly, so they don't have to be composed"""
+        return self.virtual_band_stack and self.fused_raster_pipeline
+
+    def compose_bands(self) -> None:
+        if self.stack_bands and not self.exists:
+            return # Bands are kept until the composition reads them (erase_band_files)
 
         if not self.exists:
-            filterB2 = "*_B02_10m*"
-            filterB3 = "*_B03_10m*"
-            filterB4 = "*_B04_10m*"
-            filterB8 = "*_B08_10m*"
-            bands_list = [filterB2, filterB3, filterB4, filterB8]
-            
-            downloaded_images = []
-            for band in bands_list:
-                downloaded_images.append(self._download(band=band))
-            if not downloaded_images: return
-
-            image_bands = self.get_files_by_extension(folder=images_folder, extension='.jp2')
-            image_bands.reverse()
-            CompositeBands(image_bands, self.full_path)
-
-        if Exists(images_folder):
-            Delete(images_folder)
+            self._compose_image()
+
+        self._erase_image_bands(self.images_folder)
+
+    @property
+    def band_stack(self) -> BandStack:
+        if not self.stack_bands or not self.band_files or self.exists:
+            return None
+        return BandStack(band_files=self._get_ordered_band_files())
+
+    def erase_band_files(self) -> None:
+        if self.stack_bands:
+            self._erase_image_bands(self.images_folder)
+
+    def compose_band_stack(self) -> None:
+        if self.stack_bands and self.band_files and not self.exists:
+            self._compose_image()
+            self._erase_image_bands(self.images_folder)
+
+    def _get_ordered_band_files(self) -> list:
+        # B08, B04, B03, B02 -> NIR, Red, Green, Blue
+        return [self.band_files.get(band) for band in reversed(self._bands)]
+
+    @serialize_geoprocessing
+    def _compose_image(self) -> None:
+        CompositeBands(self._get_ordered_band_files(), self.full_path)
 
 class Image(BaseDBPath):
     _masked_prefix: str = 'Msk_'
@@ -222,16 +509,29 @@ class Image(BaseDBPath):
     _stretch_prefix: str = 'Stch_'
     _copy_prefix: str = 'Copy_'
     _classification_prefix: str = 'Clssif_'
+    _clip_prefix: str = 'Clp_'
+    _clip_margin_cells: int = 2 # Edges of the area of interest may bend outside its projected envelope
+    _stretch_block_size: int = 2048 # Rows and columns of each block read by the NUMPY stretch backend
+    _stretch_num_stddev: float = 2
+    _projection_prefix: str = 'prj_'
+    _spatial_references: dict = {} # Image path -> spatial reference, shared by every composition of the run
+    _spatial_references_lock: Lock = Lock()
     mosaic_dataset: MosaicDataset = None
 
     def __init__(self, path: str, name: str = None, images_for_composition: list = [], mask: Feature = None, compose_as_single_image: bool = True, stretch_image: bool = True, *args, **kwargs):
         super(Image, self).__init__(path=path, name=name, *args, **kwargs)
-        if images_for_composition:
-            self.mosaic_images(images_for_composition=images_for_composition, compose_as_single_image=compose_as_single_image)
-        if mask and isinstance(mask, Feature):
-            self.extract_by_mask(area_of_interest=mask)
-        if stretch_image:
-            self.stretch_image()
+        if images_for_composition and self.fused_raster_pipeline and compose_as_single_image and stretch_image and self.sensor != 'CBERS':
+            self.compose_by_windows(images_for_composition=images_for_composition, mask=mask)
+        else:
+            for image in images_for_composition:
+                if hasattr(image, 'compose_band_stack'):
+                    image.compose_band_stack()
+            if images_for_composition:
+                self.mosaic_images(images_for_composition=images_for_composition, compose_as_single_image=compose_as_single_image, mask=mask)
+            if mask and isinstance(mask, Feature):
+                self.extract_by_mask(area_of_interest=mask)
+            if stretch_image:
+                self.stretch_image()
         self.get_image_dates()
     
     @staticmethod
@@ -262,13 +562,68 @@ class Image(BaseDBPath):
                 if date:
                     self.date_created = date
 
+    @wrap_on_database_editing
+    def compose_by_windows(self, images_for_composition: list, mask: Feature = None) -> str:
+        """Mosaic, mask and stretch in a single pass over the images windows, writing only the final image.
+        The intermediate Mos_ and Msk_ images are only written when keep_intermediate_rasters is set.
+        Images whose bands weren't composed are read through their band_stack. The output keeps the cell size and
+        alignment of the first image, which the reprojected images are snapped to"""
+        band_stacks, composed_images = [], []
+        for image in images_for_composition:
+            band_stack = getattr(image, 'band_stack', None)
+            if band_stack:
+                band_stacks.append(band_stack)
+            else:
+                composed_images.append(image)
+        list_of_images_paths = [*band_stacks, *(self.get_list_of_valid_paths(items=composed_images) if composed_images else [])]
+        mosaic_name = f'{self._mosaic_prefix}{self.name}'
+        masked_name = f'{self._masked_prefix}{mosaic_name}' if mask else mosaic_name
+        name = f'{self._stretch_prefix}{masked_name}'
+        if Exists(os.path.join(self.path, name)):
+            self.name = name
+            aprint(f'Encontrada Imagem com Stretch - {self.full_path}')
+            return self.full_path
+
+        list_of_images_paths = self.guarantee_images_coordinate_system(
+            list_of_images_paths,
+            area_of_interest=mask if mask and isinstance(mask, Feature) else None
+        )
+
+        clip_extent = None
+        if mask and isinstance(mask, Feature):
+            clip_extent = mask.get_extent(spatial_reference=self._get_spatial_reference(list_of_images_paths[0]))
+
+        aprint(f'Criando Mosaico, máscara e Stretch por blocos em {self.path}')
+        FusedRasterPipeline(
+            sources=list_of_images_paths,
+            mask=mask.full_path if mask and isinstance(mask, Feature) else None,
+            block_size=self._stretch_block_size,
+            num_stddev=self._stretch_num_stddev,
+            max_workers=self.n_cores,
+            temp_folder=self.temp_dir,
+            clip_extent=clip_extent
+        ).run(
+            output=os.path.join(self.path, name),
+            mosaic_output=os.path.join(self.path, mosaic_name) if self.keep_intermediate_rasters else None,
+            masked_output=os.path.join(self.path, masked_name) if self.keep_intermediate_rasters and mask else None
+        )
+        for image in images_for_composition:
+            if hasattr(image, 'erase_band_files'):
+                image.erase_band_files()
+        self.name = name
+        return self.full_path
+
     @delete_source_files
     @wrap_on_database_editing
-    def mosaic_images(self, images_for_composition: list, compose_as_single_image: bool) -> str:
+    def mosaic_images(self, images_for_composition: list, compose_as_single_image: bool, mask: Feature = None) -> str:
         list_of_images_paths = self.get_list_of_valid_paths(items=images_for_composition)
 
         if len(list_of_images_paths) == 1:
             image = list_of_images_paths[0]
+            if mask and isinstance(mask, Feature):
+                # Clipped next to the image, so the masked and stretched images stay where they were written before
+                clipped_images = self.clip_images_to_area_of_interest(images=[image], area_of_interest=mask, output_path=os.path.dirname(image))
+                image = clipped_images[0] if clipped_images else image
             self.name = os.path.basename(image)
             self.path = os.path.dirname(image)
             return self.full_path
@@ -281,6 +636,11 @@ class Image(BaseDBPath):
 
         if self.exists:
             return self.full_path
+
+        clipped_images = []
+        if mask and isinstance(mask, Feature):
+            clipped_images = self.clip_images_to_area_of_interest(images=list_of_images_paths, area_of_interest=mask)
+            list_of_images_paths = clipped_images or list_of_images_paths
         
         list_of_images_paths = self.guarantee_images_coordinate_system(list_of_images_paths)
 
@@ -298,12 +658,66 @@ class Image(BaseDBPath):
             mosaic_colormap_mode='MATCH'
         )
 
+        if self.delete_temp_files_while_processing:
+            for clipped_image in clipped_images:
+                Delete(clipped_image)
+
         return self.full_path
+
+    def clip_images_to_area_of_interest(self, images: list, area_of_interest: Feature, output_path: str = None) -> list:
+        """Clips each image to the envelope of the area of interest in the image's own spatial reference,
+        keeping its cell alignment, so the mosaic only reads and writes the pixels that can be inside the mask
+            Args:
+                images (list): Paths of the images, or their BandStack
+                area_of_interest (Feature): Area of interest
+                output_path (str, optional): Where the clipped images are written. Defaults to the temp_db.
+            Returns:
+                list: Paths of the clipped images, without the images that don't reach the area of interest
+        """
+        if not output_path:
+            output_path = self.temp_db.full_path
+        clipped_images = []
+        for image in images:
+            raster = image if isinstance(image, BandStack) else Raster(image)
+            extent = area_of_interest.get_extent(spatial_reference=raster.spatialReference)
+            if not extent or extent.disjoint(raster.extent):
+                continue
+            margin = self._clip_margin_cells*raster.meanCellWidth
+            rectangle = f'{extent.XMin - margin} {extent.YMin - margin} {extent.XMax + margin} {extent.YMax + margin}'
+            # The rectangle is part of the name, a clip of the same image for another area of interest is never reused
+            rectangle_hash = hashlib.sha1(rectangle.encode()).hexdigest()[:8]
+            output_image = os.path.join(output_path, f'{self._clip_prefix}{os.path.splitext(os.path.basename(self._get_raster_path(image)))[0]}_{rectangle_hash}')
+            if not Exists(output_image):
+                Clip(
+                    in_raster=image.as_raster() if isinstance(image, BandStack) else image,
+                    rectangle=rectangle,
+                    out_raster=output_image,
+                    clipping_geometry='NONE',
+                    maintain_clipping_extent='NO_MAINTAIN_EXTENT'
+                )
+            clipped_images.append(output_image)
+        return clipped_images
     
-    def guarantee_images_coordinate_system(self, list_of_images, out_sr: int = None) -> list:
+    @classmethod
+    def _get_spatial_reference(cls, image: any) -> SpatialReference:
+        if isinstance(image, BandStack):
+            return image.spatialReference
+        with cls._spatial_references_lock:
+            if image in cls._spatial_references:
+                return cls._spatial_references[image]
+        spatial_reference = Describe(image).spatialReference
+        with cls._spatial_references_lock:
+            cls._spatial_references[image] = spatial_reference
+        return spatial_reference
+
+    def guarantee_images_coordinate_system(self, list_of_images, out_sr: int = None, area_of_interest: Feature = None) -> list:
+        """Projects the images that aren't in out_sr (by default, the spatial reference of most images), snapped to
+        the cells of the images already in it. Those are listed first, so compositions take their grid from them.
+        Given an area_of_interest, the images are clipped to it before being projected, so only its cells are reprojected"""
         projections = {}
         for image in list_of_images:
-            proj = Describe(image).spatialReference.factoryCode
+            # arcpy runs one tool at a time, Describe included, so the lookups are made in sequence
+            proj = self._get_spatial_reference(image).factoryCode
             projections[proj] = [image, *projections.get(proj,[])]
 
         if len(projections) == 1 and not out_sr:
@@ -317,40 +731,73 @@ class Image(BaseDBPath):
                     out_sr = projection
                     biggest_list = curr_len
 
-        response = []
+        response = [*projections.get(out_sr, [])]
         for projection in projections:
             if projection != out_sr:
+                images = projections.get(projection)
+                if area_of_interest:
+                    images = self.clip_images_to_area_of_interest(images=images, area_of_interest=area_of_interest)
                 response.extend(
                     self.project_image(
-                        images=projections.get(projection),
+                        images=images,
                         out_sr=out_sr,
-                        in_memory=True
+                        in_memory=True,
+                        snap_raster=response[0] if response else None
                     )
                 )
-                continue
-            response.extend(projections.get(projection))
+                if area_of_interest and self.delete_temp_files_while_processing:
+                    for clipped_image in images:
+                        Delete(clipped_image)
 
         return response
 
-    def project_image(self, images: str = None, out_sr: int = None, in_memory: bool = False) -> list:
+    def _get_projected_name(self, image: any, out_sr: int, snap_raster: any = None) -> str:
+        """Output name unique to the image, the target spatial reference and the snap raster, so an existing output
+        is always the projection of that same image onto the same cells (short enough for IN_MEMORY)"""
+        source = ';'.join(image.band_files) if isinstance(image, BandStack) else image
+        snap = self._get_raster_path(snap_raster) if snap_raster is not None else ''
+        return f'{self._projection_prefix}{hashlib.sha1(f"{source}|{out_sr}|{snap}".encode()).hexdigest()[:12]}'
+
+    @staticmethod
+    def _get_raster_path(image: any) -> str:
+        return image.band_files[0] if isinstance(image, BandStack) else image
+
+    @staticmethod
+    def _get_cell_size(image: any) -> float:
+        return image.meanCellWidth if isinstance(image, BandStack) else Raster(image).meanCellWidth
+
+    def project_image(self, images: str = None, out_sr: int = None, in_memory: bool = False, snap_raster: any = None) -> list:
+        """Projects the images to out_sr, keeping their cell size. Given a snap_raster, the outputs take its cell size
+        and alignment, so they can be mosaicked (or read window by window) with it without resampling
+            Args:
+                images (str, optional): Paths of the images, or their BandStack. Defaults to None.
+                out_sr (int, optional): Factory code of the output spatial reference. Defaults to None.
+                in_memory (bool, optional): Writes the outputs to IN_MEMORY instead of the temp_db. Defaults to False.
+                snap_raster (any, optional): Image already in out_sr. Defaults to None.
+            Returns:
+                list: Paths of the projected images
+        """
         sr = SpatialReference(out_sr)
-        
-        path = self.temp_db.full_path
-        name = f'temp_proj_{self.name}'
-        if in_memory:
-            path = 'IN_MEMORY'
-            name = f'prj{name[-6:]}'
-            
+        path = 'IN_MEMORY' if in_memory else self.temp_db.full_path
+
+        environment = {'parallelProcessingFactor': str(self.n_cores)}
+        if snap_raster is not None:
+            environment['snapRaster'] = self._get_raster_path(snap_raster)
+
         response = []
-        for image in images:
-            output_image = os.path.join(path, name)
-            if not Exists(output_image):
-                ProjectRaster_management(
-                    image,
-                    output_image,
-                    sr
-                )[0]
-            response.append(output_image)
+        # arcpy tools run one at a time (serialize_geoprocessing), each projection is spread over the cores instead
+        with EnvManager(**environment):
+            for image in images:
+                output_image = os.path.join(path, self._get_projected_name(image=image, out_sr=out_sr, snap_raster=snap_raster))
+                if not Exists(output_image):
+                    aprint(f'Projetando imagem para {out_sr}: {output_image}')
+                    ProjectRaster_management(
+                        image.as_raster() if isinstance(image, BandStack) else image,
+                        output_image,
+                        sr,
+                        cell_size=self._get_cell_size(snap_raster if snap_raster is not None else image)
+                    )
+                response.append(output_image)
         return response
 
     @delete_source_files
@@ -388,6 +835,12 @@ class Image(BaseDBPath):
             return self.full_path
         
         aprint(f'Aplicando Strech na Imagem {self.full_path}')
+        if self.stretch_backend == 'NUMPY':
+            output = os.path.join(self.path, name)
+            self._stretch_by_blocks(output=output)
+            self.name = name
+            return self.full_path
+
         stretch = Stretch(
             raster=self.full_path,
             stretch_type="StdDev",
@@ -407,6 +860,16 @@ class Image(BaseDBPath):
 
         return self.full_path
 
+    @serialize_geoprocessing
+    def _stretch_by_blocks(self, output: str) -> str:
+        return stretch_raster(
+            raster_path=self.full_path,
+            output=output,
+            block_size=self._stretch_block_size,
+            num_stddev=self._stretch_num_stddev,
+            max_workers=self.n_cores
+        )
+
     def copy_image(self, pixel_type: str = '', nodata_value: str = '', background_value: float = None, destination: str or Database = None, delete_source: bool = False, output_name: str = '', format: str = 'GRID') -> str:
         """Creates a copy of the current image
             Args:
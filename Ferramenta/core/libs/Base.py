@@ -3,6 +3,7 @@
 import os
 import time
 from datetime import date, datetime
+from threading import RLock
 from zipfile import ZipFile
 
 from arcpy import Exists
@@ -13,8 +14,13 @@ from core.libs.ProgressTracking import ProgressTracker
 from requests.exceptions import ConnectionError
 from sentinelsat.exceptions import ServerError as SetinelServerError
 
-from .CustomExceptions import (FolderAccessError, InvalidPathError,
-                           MaxFailuresError, UnexistingFeatureError)
+from .CustomExceptions import (CircuitOpenError, FolderAccessError,
+                               InvalidPathError, MaxFailuresError,
+                               RequestRejectedError, UnexistingFeatureError)
+from .RetryPolicy import RetryPolicy
+
+
+geoprocessing_lock = RLock()
 
 
 def load_path_and_name(wrapped):
@@ -47,25 +53,49 @@ def delete_source_files(wrapped):
         return response
     return wrapper
 
-def prevent_server_error(wrapped_function):
+def serialize_geoprocessing(wrapped_function):
+    """arcpy tools and editing sessions share the workspace environment of the process,
+    so concurrent acquisition workers have to run them one at a time"""
+    def wrapper(*args, **kwargs):
+        with geoprocessing_lock:
+            return wrapped_function(*args, **kwargs)
+    return wrapper
+
+def prevent_server_error(wrapped_function=None, policy: RetryPolicy = None):
+    """Retries the decorated method on failure. Used bare it keeps the original linear retries,
+    `@prevent_server_error(policy=...)` opts in to a different RetryPolicy"""
+    if wrapped_function is None:
+        return lambda function: prevent_server_error(function, policy=policy)
+    if policy is None:
+        policy = RetryPolicy()
+
     def reattempt_execution(*args, **kwargs):
+        host = policy.get_host(args, kwargs)
         failed_attempts = 0
         while True:
+            policy.before_attempt(host)
             try:
-                return wrapped_function(*args, **kwargs)
+                response = wrapped_function(*args, **kwargs)
+                policy.record_success(host)
+                return response
+            except (CircuitOpenError, RequestRejectedError):
+                raise
             except Exception as e:
-                if failed_attempts > MaxFailuresError.max_failures:
-                    raise MaxFailuresError(wrapped_function.__name__, attempts=failed_attempts)
+                policy.record_failure(host, error=e)
+                if not policy.is_retryable(e):
+                    # Only this request is given up on, the caller decides whether the run goes on
+                    raise RequestRejectedError(wrapped_function.__name__, error=e)
+                if failed_attempts > policy.max_failures:
+                    raise MaxFailuresError(wrapped_function.__name__, attempts=failed_attempts+1, error=e)
+                failed_attempts += 1
+                wait_time = policy.get_wait_time(failed_attempts, error=e)
                 if isinstance(e, SetinelServerError):
-                    aprint(f'Sentinel Server error:\n Erro: {e}\nReconectando em {failed_attempts*MaxFailuresError.wait_time_seconds} segundos...', level=LogLevels.WARNING)
-                    failed_attempts += 1
+                    aprint(f'Sentinel Server error:\n Erro: {e}\nReconectando em {wait_time:.0f} segundos...', level=LogLevels.WARNING)
                 elif isinstance(e, ConnectionError):
-                    aprint(f'CBERS Server error:\n Erro: {e}\nReconectando em {failed_attempts*MaxFailuresError.wait_time_seconds} segundos...', level=LogLevels.WARNING)
-                    failed_attempts += 1
+                    aprint(f'CBERS Server error:\n Erro: {e}\nReconectando em {wait_time:.0f} segundos...', level=LogLevels.WARNING)
                 else:
-                    aprint(f'Erro de API não reconhecido:\n Erro: {e}\nReconectando em {failed_attempts*MaxFailuresError.wait_time_seconds} segundos...', level=LogLevels.WARNING)
-                    failed_attempts += 1
-                time.sleep(failed_attempts*MaxFailuresError.wait_time_seconds)
+                    aprint(f'Erro de API não reconhecido:\n Erro: {e}\nReconectando em {wait_time:.0f} segundos...', level=LogLevels.WARNING)
+                time.sleep(wait_time)
     return reattempt_execution
 
 class BasePath:
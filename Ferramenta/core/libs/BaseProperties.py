@@ -10,11 +10,18 @@ from core._logs import *
 from core.instances.Database import Database
 from core.libs.Base import BasePath
 from core.libs.CustomExceptions import DeletionError
+from core.libs.DownloadCache import SceneCache, remove_stale_staging_folders
+from core.libs.DownloadGovernor import DownloadGovernor
+from core.libs.SceneCatalog import SceneCatalog
 
 
 class BaseProperties(BasePath):
     _temp_db: Database = None
     _image_storage: str = None
+    _scene_cache: SceneCache = None
+    _staging_storage: str = None
+    _download_governor: DownloadGovernor = None
+    _scene_catalog: SceneCatalog = None
     
     @property
     def delete_temp_files_while_processing(self) -> bool:
@@ -32,6 +39,66 @@ class BaseProperties(BasePath):
     def download_storage(self) -> str:
         return os.environ.get('DOWNLOAD_STORAGE', DOWNLOADS_DIR)
 
+    @property
+    def staging_storage(self) -> str:
+        """Download folder of this process, runs sharing the DOWNLOAD_STORAGE never write to the same partial files.
+        Finished bands are moved from here into the scene_cache. Folders of runs that are no longer alive
+        are removed the first time it is used"""
+        if not self._staging_storage:
+            staging_root = os.path.join(self.download_storage, 'Staging')
+            remove_stale_staging_folders(path=staging_root)
+            BaseProperties._staging_storage = os.path.join(staging_root, str(os.getpid()))
+        return self._staging_storage
+
+    @property
+    def download_cache_size_gb(self) -> float:
+        return float(os.environ.get('DOWNLOAD_CACHE_SIZE_GB', 50))
+
+    @property
+    def scene_cache(self) -> SceneCache:
+        if not self._scene_cache:
+            BaseProperties._scene_cache = SceneCache(
+                path=os.path.join(self.download_storage, 'Scene_Cache'),
+                max_size_gb=self.download_cache_size_gb
+            )
+        return self._scene_cache
+
+    @property
+    def scene_catalog_ingestion_lag_days(self) -> int:
+        return int(os.environ.get('SCENE_CATALOG_INGESTION_LAG_DAYS', 3))
+
+    @property
+    def scene_catalog(self) -> SceneCatalog:
+        if not self._scene_catalog:
+            BaseProperties._scene_catalog = SceneCatalog(
+                path=os.path.join(self.download_storage, 'Scene_Catalog.sqlite'),
+                ingestion_lag_days=self.scene_catalog_ingestion_lag_days
+            )
+        return self._scene_catalog
+
+    @property
+    def download_max_rate_mbps(self) -> float:
+        return float(os.environ.get('DOWNLOAD_MAX_RATE_MBPS', 0))
+
+    @property
+    def download_max_per_host(self) -> int:
+        return int(os.environ.get('DOWNLOAD_MAX_PER_HOST', 4))
+
+    @property
+    def download_max_global(self) -> int:
+        return int(os.environ.get('DOWNLOAD_MAX_GLOBAL', 8))
+
+    @property
+    def download_governor(self) -> DownloadGovernor:
+        """Limits shared by every imagery download of the process"""
+        if not self._download_governor:
+            BaseProperties._download_governor = DownloadGovernor(
+                max_rate_mbps=self.download_max_rate_mbps,
+                max_per_host=self.download_max_per_host,
+                max_global=self.download_max_global
+            )
+        return self._download_governor
+
     @property
     def image_storage(self) -> str:
         if not self._image_storage:
@@ -55,6 +122,34 @@ class BaseProperties(BasePath):
             n_cores = os.cpu_count()
         return n_cores
         
+    @property
+    def acquisition_mode(self) -> str:
+        return os.environ.get('ACQUISITION_MODE', 'THREADS').upper()
+
+    @property
+    def stretch_backend(self) -> str:
+        return os.environ.get('STRETCH_BACKEND', 'ARCPY').upper()
+
+    @property
+    def fused_raster_pipeline(self) -> bool:
+        return os.environ.get('FUSED_RASTER_PIPELINE', 'False') == 'True'
+
+    @property
+    def virtual_band_stack(self) -> bool:
+        return os.environ.get('VIRTUAL_BAND_STACK', 'False') == 'True'
+
+    @property
+    def keep_intermediate_rasters(self) -> bool:
+        return os.environ.get('KEEP_INTERMEDIATE_RASTERS', 'False') == 'True'
+
+    @property
+    def http_pool_size(self) -> int:
+        return int(os.environ.get('HTTP_POOL_SIZE', 10))
+
+    @property
+    def http_timeout_seconds(self) -> int:
+        return int(os.environ.get('HTTP_TIMEOUT_SECONDS', 60))
+
     @property
     def use_arcpy_append(self) -> bool:
         return os.environ.get('USE_ARCPY_APPEND', 'True') == 'True'
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
+
+import numpy as np
+
+
+class BandStatistics:
+    """Mean and standard deviation of each band, merged block by block (Welford/Chan),
+    so the statistics of a raster are computed without holding it in memory"""
+
+    def __init__(self, band_count: int) -> None:
+        self.count = np.zeros(band_count, dtype=np.int64)
+        self.mean = np.zeros(band_count, dtype=np.float64)
+        self.m2 = np.zeros(band_count, dtype=np.float64) # Sum of the squared differences from the mean
+
+    @staticmethod
+    def get_valid_pixels(block: np.ndarray, nodata: float = None) -> np.ndarray:
+        valid_pixels = np.ones(block.shape, dtype=bool) if nodata is None else block != nodata
+        if np.issubdtype(block.dtype, np.floating):
+            valid_pixels &= ~np.isnan(block)
+        return valid_pixels
+
+    @classmethod
+    def from_block(cls, block: np.ndarray, nodata: float = None) -> 'BandStatistics':
+        """Statistics of a (bands, rows, columns) block, ignoring the nodata pixels"""
+        statistics = cls(band_count=block.shape[0])
+        valid_pixels = cls.get_valid_pixels(block=block, nodata=nodata)
+        values = np.where(valid_pixels, block, 0).astype(np.float64)
+        statistics.count = valid_pixels.sum(axis=(1, 2))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            statistics.mean = np.where(statistics.count > 0, values.sum(axis=(1, 2))/statistics.count, 0)
+        deviations = np.where(valid_pixels, values - statistics.mean[:, None, None], 0)
+        statistics.m2 = (deviations*deviations).sum(axis=(1, 2))
+        return statistics
+
+    def merge(self, other: 'BandStatistics') -> None:
+        """Adds the pixels of other to these statistics"""
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean = np.where(count > 0, self.mean + delta*other.count/count, 0)
+            self.m2 = np.where(count > 0, self.m2 + other.m2 + delta*delta*self.count*other.count/count, 0)
+        self.count = count
+
+    @property
+    def std(self) -> np.ndarray:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 0, np.sqrt(self.m2/self.count), 0)
+
+
+def stretch_block(block: np.ndarray, mean: np.ndarray, std: np.ndarray, num_stddev: float = 2, nodata: float = None) -> np.ndarray:
+    """StdDev stretch of a (bands, rows, columns) block to 8 bits: mean ± num_stddev standard deviations
+    of each band are mapped to 1-255, values beyond them are clipped and nodata pixels become 0
+        Returns:
+            np.ndarray: uint8 block, with the same shape as the input
+    """
+    low = (mean - num_stddev*std)[:, None, None]
+    high = (mean + num_stddev*std)[:, None, None]
+    scale = np.where(high > low, 254/np.where(high > low, high - low, 1), 0)
+    valid_pixels = BandStatistics.get_valid_pixels(block=block, nodata=nodata)
+    stretched = np.clip(np.rint((np.where(valid_pixels, block, 0).astype(np.float64) - low)*scale) + 1, 1, 255).astype(np.uint8)
+    stretched[~valid_pixels] = 0
+    return stretched
+
+
+def map_blocks(function: callable, blocks: Iterator, max_workers: int = 4) -> Iterator:
+    """Applies function to each block on a thread pool, yielding the results in the order of the blocks.
+    At most max_workers blocks are in flight at a time, so the raster is never loaded as a whole"""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for block in blocks:
+            pending.append(executor.submit(function, block))
+            if len(pending) >= max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -174,4 +174,40 @@ class PathINMEMORY(Error):
     def __init__(self, feature):
         message = f'IN_MEMORY path informado para {feature}'
         super().__init__(message)
-        
\ No newline at end of file
+
+class IncompleteDownloadError(Error):
+    interrupt_execution: bool = False
+
+    def __init__(self, file: str, downloaded: int = 0, expected: int = 0):
+        message = f'Download incompleto de {file}: {downloaded} de {expected} bytes recebidos'
+        super().__init__(message, log_level=LogLevels.WARNING)
+
+class ChecksumMismatchError(Error):
+    interrupt_execution: bool = False
+
+    def __init__(self, file: str):
+        message = f'Checksum de {file} não confere com o manifesto do produto, o arquivo será baixado novamente'
+        super().__init__(message, log_level=LogLevels.WARNING)
+
+class CircuitOpenError(Error):
+    interrupt_execution: bool = False
+
+    def __init__(self, host: str, error: Error = ''):
+        self.host = host
+        message = f'Servidor {host} temporariamente bloqueado após falhas consecutivas, requisição cancelada.\n{error}'
+        super().__init__(message, log_level=LogLevels.WARNING)
+
+class RequestRejectedError(Error):
+    interrupt_execution: bool = False
+
+    def __init__(self, method: str, error: Error = ''):
+        self.method = method
+        message = f'Requisição do método {method} recusada pelo servidor e não será repetida.\n{error}'
+        super().__init__(message, log_level=LogLevels.WARNING)
+
+class ImageSearchError(Error):
+    interrupt_execution: bool = False
+
+    def __init__(self, sensor: str, error: Error = ''):
+        message = f'Não foram encontradas imagens que se enquadrem nos parâmetros ({sensor}).\n{error}'
+        super().__init__(message, log_level=LogLevels.WARNING)
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+import os
+import shutil
+import time
+
+from core._logs import *
+
+
+def is_process_running(pid: int) -> bool:
+    """Whether a process with this id is still alive, without signaling it"""
+    if os.name == 'nt':
+        import ctypes
+        process_query_limited_information, still_active = 0x1000, 259
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(process_query_limited_information, False, pid)
+        if not handle:
+            return False
+        try:
+            exit_code = ctypes.c_ulong()
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))) and exit_code.value == still_active
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass # Alive, but owned by another user
+    return True
+
+
+def remove_stale_staging_folders(path: str) -> None:
+    """Deletes the staging folders (named by process id) left behind by runs that crashed or were killed,
+    their partial files are never resumed and would grow the DOWNLOAD_STORAGE outside the SceneCache budget"""
+    if not os.path.exists(path):
+        return
+    for folder in os.listdir(path):
+        if not folder.isdigit() or int(folder) == os.getpid() or is_process_running(int(folder)):
+            continue
+        aprint(f'Removendo downloads parciais de uma execução interrompida: {folder}', level=LogLevels.DEBUG)
+        shutil.rmtree(os.path.join(path, folder), ignore_errors=True)
+
+
+class CacheLock:
+    """Lock file shared by every process using the same cache folder"""
+    stale_after_seconds: int = 10*60 # A lock older then this was left behind by a crashed run
+    wait_time_seconds: float = 0.5
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def __enter__(self):
+        while True:
+            try:
+                os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.stale_after_seconds:
+                        os.remove(self.path)
+                        continue
+                except OSError:
+                    continue # Released (or removed) by its owner in the meantime
+                time.sleep(self.wait_time_seconds)
+
+    def __exit__(self, *args) -> None:
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class SceneCache:
+    """Persistent cache of downloaded band files, keyed by scene id (Sentinel uuid/CBERS id) and band.
+    Entries are evicted by least recent use once the folder exceeds its disk budget.
+    Files are moved in with atomic renames and eviction runs under a lock file, so multiple runs
+    can share the same DOWNLOAD_STORAGE"""
+    lock_name: str = '.cache.lock'
+    min_entry_age_seconds: int = 60*60 # Recently used entries may still be read by a concurrent run
+
+    def __init__(self, path: str, max_size_gb: float = 0) -> None:
+        self.path = path
+        self.max_size_bytes = int(float(max_size_gb)*1024**3)
+        if self.enabled and not os.path.exists(self.path):
+            os.makedirs(self.path, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size_bytes > 0
+
+    def _scene_folder(self, scene_id: str) -> str:
+        return os.path.join(self.path, str(scene_id))
+
+    def get(self, scene_id: str, band: str) -> str:
+        """Returns the cached band file path, or None if the band isn't cached"""
+        if not self.enabled:
+            return None
+        scene_folder = self._scene_folder(scene_id)
+        if not os.path.exists(scene_folder):
+            return None
+        for file in os.listdir(scene_folder):
+            if os.path.splitext(file)[0] == band:
+                file_path = os.path.join(scene_folder, file)
+                try:
+                    os.utime(file_path) # Marks the entry as recently used
+                except OSError:
+                    pass
+                return file_path
+
+    def put(self, scene_id: str, band: str, file: str) -> str:
+        """Moves a downloaded band file into the cache
+            Args:
+                scene_id (str): Scene identifier
+                band (str): Band key
+                file (str): Downloaded file, on the same drive as the cache
+            Returns:
+                str: Path to the file that should be used from now on
+        """
+        if not self.enabled:
+            return file
+
+        scene_folder = self._scene_folder(scene_id)
+        os.makedirs(scene_folder, exist_ok=True)
+        cached_file = os.path.join(scene_folder, f'{band}{os.path.splitext(file)[-1]}')
+
+        if os.path.exists(cached_file):
+            # Another run cached the same band first, its copy is kept
+            os.remove(file)
+            os.utime(cached_file)
+            return cached_file
+
+        try:
+            os.replace(file, cached_file)
+        except OSError:
+            if not os.path.exists(cached_file):
+                raise
+            os.remove(file) # Lost the race against another run caching the same band
+            return cached_file
+
+        self.evict()
+        return cached_file
+
+    def evict(self) -> None:
+        """Deletes the least recently used entries until the cache fits in its disk budget"""
+        if not self.enabled:
+            return
+
+        with CacheLock(os.path.join(self.path, self.lock_name)):
+            entries = []
+            for path, dirs, files in os.walk(self.path):
+                for file in files:
+                    if file == self.lock_name:
+                        continue
+                    file_path = os.path.join(path, file)
+                    try:
+                        stat = os.stat(file_path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, file_path))
+
+            cache_size = sum(entry[1] for entry in entries)
+            if cache_size <= self.max_size_bytes:
+                return
+
+            now = time.time()
+            entries.sort()
+            for last_used, size, file_path in entries:
+                if cache_size <= self.max_size_bytes:
+                    break
+                if now - last_used < self.min_entry_age_seconds:
+                    break # Every remaining entry is even more recent
+                try:
+                    os.remove(file_path)
+                    cache_size -= size
+                except OSError:
+                    continue # Still open by another run
+                scene_folder = os.path.dirname(file_path)
+                if not os.listdir(scene_folder):
+                    shutil.rmtree(scene_folder, ignore_errors=True)
+
+            if cache_size > self.max_size_bytes:
+                aprint(f'Cache de downloads acima do limite ({cache_size/1024**3:.2f} GB), entradas em uso recente foram mantidas', level=LogLevels.WARNING)
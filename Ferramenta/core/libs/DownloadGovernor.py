@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+import time
+from contextlib import contextmanager
+from threading import BoundedSemaphore, Lock
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """Byte rate limiter shared by every thread, with a burst of up to one second of transfer"""
+
+    def __init__(self, rate_bytes_per_second: float) -> None:
+        self.rate = float(rate_bytes_per_second)
+        self.capacity = self.rate
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = Lock()
+
+    def consume(self, amount: int) -> None:
+        """Takes amount bytes from the bucket, sleeping for as long as the transfer is ahead of the rate"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last_refill)*self.rate)
+            self._last_refill = now
+            self._tokens -= amount
+            wait_time = -self._tokens/self.rate if self._tokens < 0 else 0
+        if wait_time:
+            time.sleep(wait_time)
+
+
+class DownloadGovernor:
+    """Limits every imagery download of the process: total byte rate, downloads in flight per host
+    and downloads in flight overall. Zero disables the corresponding limit"""
+
+    def __init__(self, max_rate_mbps: float = 0, max_per_host: int = 0, max_global: int = 0) -> None:
+        self.max_per_host = int(max_per_host)
+        self.bucket = TokenBucket(rate_bytes_per_second=float(max_rate_mbps)*1000*1000/8) if max_rate_mbps else None
+        self._global_slots = BoundedSemaphore(int(max_global)) if max_global else None
+        self._host_slots = {}
+        self._lock = Lock()
+
+    def _get_host_slots(self, url: str) -> BoundedSemaphore:
+        if not self.max_per_host:
+            return None
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = BoundedSemaphore(self.max_per_host)
+            return self._host_slots[host]
+
+    @contextmanager
+    def slot(self, url: str):
+        """Holds a download slot for url's host and a global one while the transfer runs"""
+        # The host slot is taken first, so a download waiting for its host doesn't block a global slot
+        host_slots = self._get_host_slots(url)
+        if host_slots:
+            host_slots.acquire()
+        if self._global_slots:
+            self._global_slots.acquire()
+        try:
+            yield self
+        finally:
+            if self._global_slots:
+                self._global_slots.release()
+            if host_slots:
+                host_slots.release()
+
+    def throttle(self, received_bytes: int) -> None:
+        if self.bucket:
+            self.bucket.consume(received_bytes)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+import hashlib
+import os
+import re
+from http import HTTPStatus
+
+import requests
+from requests.adapters import HTTPAdapter
+from core._logs import *
+from core.libs.CustomExceptions import (ChecksumMismatchError,
+                                        IncompleteDownloadError)
+from core.libs.DownloadGovernor import DownloadGovernor
+
+
+def create_pooled_session(pool_size: int = 10) -> requests.Session:
+    """Creates a keep-alive HTTP session that keeps up to pool_size open connections per host"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class ResumableDownloader:
+    """Downloads files over HTTP into a `.part` file, resuming interrupted transfers with `Range` requests
+    and only moving the file into place once its size matches the one announced by the server (or the caller)
+    and its checksum, when given, matches the received bytes"""
+    part_extension: str = '.part'
+    chunk_size: int = 64*1024 # Small chunks keep most of the received bytes when a connection drops
+    session: requests.Session = None
+    timeout: int = None
+    governor: DownloadGovernor = None
+
+    def __init__(self, session: requests.Session = None, timeout: int = None, governor: DownloadGovernor = None) -> None:
+        self.session = session if session else requests.Session()
+        self.timeout = timeout
+        self.governor = governor if governor else DownloadGovernor()
+
+    def download(self, url: str, filepath: str, checksum: str = None, checksum_algorithm: str = 'md5', expected_size: int = None) -> str:
+        """Downloads the url content to filepath, resuming from a previous `.part` file when there is one
+            Args:
+                url (str): File url
+                filepath (str): Final path of the downloaded file
+                checksum (str, optional): Expected hex digest, hashed while the bytes are written. Defaults to None.
+                checksum_algorithm (str, optional): hashlib algorithm name of the checksum. Defaults to 'md5'.
+                expected_size (int, optional): File size known beforehand (e.g. from a manifest), used when
+                    the server doesn't announce it. Defaults to None.
+            Raises:
+                IncompleteDownloadError: The transfer ended before the announced size was reached
+                ChecksumMismatchError: The downloaded bytes don't match the expected checksum
+            Returns:
+                str: Path to the downloaded file
+        """
+        if os.path.exists(filepath):
+            return filepath
+
+        with self.governor.slot(url):
+            return self._download(url=url, filepath=filepath, checksum=checksum, checksum_algorithm=checksum_algorithm, expected_size=expected_size)
+
+    def _download(self, url: str, filepath: str, checksum: str = None, checksum_algorithm: str = 'md5', expected_size: int = None) -> str:
+        part_path = f'{filepath}{self.part_extension}'
+        downloaded_bytes = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        hasher = hashlib.new(checksum_algorithm) if checksum else None
+
+        headers = {}
+        if downloaded_bytes:
+            headers['Range'] = f'bytes={downloaded_bytes}-'
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE.value:
+                # The .part file already holds every byte (or more than the server has)
+                expected_size = self._get_total_size(response.headers.get('Content-Range')) or expected_size
+                if expected_size is None:
+                    # Nothing tells whether the .part file is complete, so it is downloaded again from the start
+                    response.close()
+                    os.remove(part_path)
+                    return self._download(url=url, filepath=filepath, checksum=checksum, checksum_algorithm=checksum_algorithm)
+                if hasher and downloaded_bytes == expected_size:
+                    self._hash_file(hasher=hasher, file=part_path)
+                    self._verify_checksum(part_path=part_path, filepath=filepath, hasher=hasher, checksum=checksum)
+                return self._move_into_place(part_path=part_path, filepath=filepath, expected_size=expected_size)
+
+            response.raise_for_status()
+
+            if downloaded_bytes and response.status_code != HTTPStatus.PARTIAL_CONTENT.value:
+                aprint(f'Servidor não suporta retomada de download, reiniciando {os.path.basename(filepath)}', level=LogLevels.WARNING)
+                downloaded_bytes = 0
+
+            expected_size = self._get_expected_size(response=response, downloaded_bytes=downloaded_bytes) or expected_size
+            if hasher and downloaded_bytes:
+                self._hash_file(hasher=hasher, file=part_path) # Only resumed transfers read bytes back from disk
+            with open(part_path, 'ab' if downloaded_bytes else 'wb') as part_file:
+                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                    if chunk:
+                        part_file.write(chunk)
+                        if hasher:
+                            hasher.update(chunk)
+                        self.governor.throttle(len(chunk))
+
+        # A .part file shorter than the known size is kept to be resumed, anything else is verified
+        if hasher and (expected_size is None or os.path.getsize(part_path) >= expected_size):
+            self._verify_checksum(part_path=part_path, filepath=filepath, hasher=hasher, checksum=checksum)
+
+        return self._move_into_place(part_path=part_path, filepath=filepath, expected_size=expected_size)
+
+    def _hash_file(self, hasher: any, file: str) -> None:
+        with open(file, 'rb') as existing_file:
+            for chunk in iter(lambda: existing_file.read(self.chunk_size), b''):
+                hasher.update(chunk)
+
+    @staticmethod
+    def _verify_checksum(part_path: str, filepath: str, hasher: any, checksum: str) -> None:
+        if hasher.hexdigest().lower() != checksum.strip().lower():
+            os.remove(part_path) # Corrupted content can't be resumed, the next attempt starts over
+            raise ChecksumMismatchError(file=filepath)
+
+    def _get_expected_size(self, response: requests.Response, downloaded_bytes: int = 0) -> int:
+        if response.status_code == HTTPStatus.PARTIAL_CONTENT.value:
+            total_size = self._get_total_size(response.headers.get('Content-Range'))
+            if total_size is not None:
+                return total_size
+
+        content_length = response.headers.get('Content-Length')
+        if content_length is None or not content_length.isdigit():
+            return None
+        return downloaded_bytes + int(content_length)
+
+    @staticmethod
+    def _get_total_size(content_range: str) -> int:
+        """Reads the total size from a `Content-Range: bytes 100-199/200` (or `bytes */200`) header"""
+        if not content_range:
+            return None
+        match = re.match(r'bytes\s+(?:\d+-\d+|\*)/(\d+)', content_range)
+        if match:
+            return int(match.group(1))
+
+    def _move_into_place(self, part_path: str, filepath: str, expected_size: int = None) -> str:
+        current_size = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+        if expected_size is not None and current_size != expected_size:
+            if current_size > expected_size:
+                os.remove(part_path) # Nothing to resume from a file bigger then the original
+            raise IncompleteDownloadError(file=filepath, downloaded=current_size, expected=expected_size)
+
+        os.replace(part_path, filepath)
+        return filepath
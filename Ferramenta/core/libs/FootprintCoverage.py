@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+from arcpy import AsShape, Polygon, SpatialReference
+
+
+def geojson_to_geometry(geojson: dict, spatial_reference: SpatialReference = None) -> Polygon:
+    """Converts a WGS84 GeoJSON Polygon/MultiPolygon footprint to an arcpy polygon
+        Args:
+            geojson (dict): Footprint geometry, as returned by the imagery searches
+            spatial_reference (SpatialReference, optional): Projects the polygon to it. Defaults to None.
+        Returns:
+            Polygon: Footprint polygon, or None if the footprint isn't a polygon
+    """
+    if not geojson or geojson.get('type') not in ['Polygon', 'MultiPolygon']:
+        return None
+    geometry = Polygon(AsShape(geojson).getPart(), SpatialReference(4326))
+    if spatial_reference:
+        geometry = geometry.projectAs(spatial_reference)
+    return geometry
+
+
+class FootprintCoverageSelector:
+    """Chooses, from the most recent scene to the oldest, the scenes whose footprints add to the union
+    coverage of a target area (tile ∩ area of interest), until target_coverage is reached.
+    Scenes that only cover what more recent scenes already cover are never selected"""
+
+    def __init__(self, target_area: Polygon, target_coverage: float = 98, min_contribution: float = 1.5) -> None:
+        self.target_area = target_area
+        self.target_coverage = target_coverage
+        self.min_contribution = min_contribution
+
+    def coverage(self, geometry: Polygon) -> float:
+        """Percentage of the target area covered by the geometry"""
+        if not geometry or not self.target_area.area:
+            return 0
+        return geometry.area/self.target_area.area*100
+
+    def get_footprint(self, image: any) -> Polygon:
+        """Part of the target area inside the image footprint"""
+        footprint = geojson_to_geometry(getattr(image, 'geometry', None), spatial_reference=self.target_area.spatialReference)
+        if footprint is None:
+            return None
+        return footprint.intersect(self.target_area, 4)
+
+    def select(self, images: list) -> list:
+        """Selects the minimal set of most recent images reaching the target coverage
+            Args:
+                images (list): Candidate images, with their footprint GeoJSON in `geometry`
+            Returns:
+                list: Selected images, the most recent first. None if an image has no footprint to evaluate
+        """
+        footprints = [(image, self.get_footprint(image)) for image in sorted(images, key=lambda image: image.datetime, reverse=True)]
+        if any(footprint is None for image, footprint in footprints):
+            return None
+
+        selected_images = []
+        covered_area = None
+        for image, footprint in footprints:
+            new_area = footprint.difference(covered_area) if covered_area else footprint
+            if self.coverage(new_area) < self.min_contribution:
+                continue # Adds nothing (or almost nothing) to the more recent scenes
+            selected_images.append(image)
+            covered_area = covered_area.union(footprint) if covered_area else footprint
+            if self.coverage(covered_area) >= self.target_coverage:
+                break
+        return selected_images
@@ -0,0 +1,345 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+import os
+import shutil
+import tempfile
+from typing import Iterator
+
+import numpy as np
+from arcpy import (Describe, EnvManager, Extent, Point, Raster, RasterInfo,
+                   RasterToNumPyArray)
+from arcpy.conversion import FeatureToRaster
+from arcpy.ia import CompositeBand
+from core._logs import *
+
+from .BlockStretch import BandStatistics, map_blocks, stretch_block
+
+
+class BandStack:
+    """Separate single band files (JP2/TIF) exposed as one multiband raster, without composing them on disk.
+    NumPy consumers read it window by window and arcpy tools get an on the fly composite (as_raster).
+    The bands must share the same grid, as the 10m Sentinel-2 bands do"""
+
+    def __init__(self, band_files: list) -> None:
+        self.band_files = band_files
+        self.bands = [Raster(band_file) for band_file in band_files]
+        first_band = self.bands[0]
+        self.extent = first_band.extent
+        self.width = first_band.width
+        self.height = first_band.height
+        self.meanCellWidth = first_band.meanCellWidth
+        self.meanCellHeight = first_band.meanCellHeight
+        self.spatialReference = first_band.spatialReference
+        self.noDataValue = first_band.noDataValue
+        self.bandCount = len(self.bands)
+
+    def read(self, lower_left_corner: Point, ncols: int, nrows: int, nodata_to_value: float = None) -> np.ndarray:
+        """Same as RasterToNumPyArray over a multiband raster: a (bands, rows, columns) array"""
+        return np.stack([RasterToNumPyArray(band, lower_left_corner, ncols, nrows, nodata_to_value) for band in self.bands])
+
+    def as_raster(self) -> Raster:
+        return CompositeBand(self.bands)
+
+
+def read_array(raster: any, lower_left_corner: Point, ncols: int, nrows: int, nodata_to_value: float = None) -> np.ndarray:
+    if isinstance(raster, BandStack):
+        return raster.read(lower_left_corner, ncols, nrows, nodata_to_value)
+    return RasterToNumPyArray(raster, lower_left_corner, ncols, nrows, nodata_to_value)
+
+
+class RasterGrid:
+    """Cells of an output raster, read and written in windows of (first row, first column, rows, columns)"""
+
+    def __init__(self, xmin: float, ymax: float, cell_width: float, cell_height: float, columns: int, rows: int, spatial_reference: any) -> None:
+        self.xmin = xmin
+        self.ymax = ymax
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.columns = columns
+        self.rows = rows
+        self.spatial_reference = spatial_reference
+
+    @classmethod
+    def from_raster(cls, raster: Raster) -> 'RasterGrid':
+        return cls(
+            xmin=raster.extent.XMin,
+            ymax=raster.extent.YMax,
+            cell_width=raster.meanCellWidth,
+            cell_height=raster.meanCellHeight,
+            columns=raster.width,
+            rows=raster.height,
+            spatial_reference=raster.spatialReference
+        )
+
+    @classmethod
+    def from_rasters(cls, rasters: list, cell_size: float = None) -> 'RasterGrid':
+        """Grid covering every raster, aligned to the cells of the first one"""
+        first_raster = rasters[0]
+        cell_width = cell_size or first_raster.meanCellWidth
+        cell_height = cell_size or first_raster.meanCellHeight
+        origin_x, origin_y = first_raster.extent.XMin, first_raster.extent.YMax
+        xmin = origin_x + np.floor((min(raster.extent.XMin for raster in rasters) - origin_x)/cell_width)*cell_width
+        ymax = origin_y + np.ceil((max(raster.extent.YMax for raster in rasters) - origin_y)/cell_height)*cell_height
+        xmax = max(raster.extent.XMax for raster in rasters)
+        ymin = min(raster.extent.YMin for raster in rasters)
+        return cls(
+            xmin=float(xmin),
+            ymax=float(ymax),
+            cell_width=cell_width,
+            cell_height=cell_height,
+            columns=int(np.ceil(round((xmax - xmin)/cell_width, 6))),
+            rows=int(np.ceil(round((ymax - ymin)/cell_height, 6))),
+            spatial_reference=first_raster.spatialReference
+        )
+
+    def clip(self, extent: Extent, margin_cells: int = 0) -> 'RasterGrid':
+        """Cells of the grid inside extent (expanded by margin_cells), keeping the grid alignment"""
+        first_column = max(0, int(np.floor((extent.XMin - self.xmin)/self.cell_width)) - margin_cells)
+        last_column = min(self.columns, int(np.ceil((extent.XMax - self.xmin)/self.cell_width)) + margin_cells)
+        first_row = max(0, int(np.floor((self.ymax - extent.YMax)/self.cell_height)) - margin_cells)
+        last_row = min(self.rows, int(np.ceil((self.ymax - extent.YMin)/self.cell_height)) + margin_cells)
+        return RasterGrid(
+            xmin=self.xmin + first_column*self.cell_width,
+            ymax=self.ymax - first_row*self.cell_height,
+            cell_width=self.cell_width,
+            cell_height=self.cell_height,
+            columns=max(last_column - first_column, 0),
+            rows=max(last_row - first_row, 0),
+            spatial_reference=self.spatial_reference
+        )
+
+    @property
+    def extent(self) -> Extent:
+        return Extent(self.xmin, self.ymax - self.rows*self.cell_height, self.xmin + self.columns*self.cell_width, self.ymax)
+
+    def windows(self, block_size: int = 2048) -> Iterator[tuple]:
+        for first_row in range(0, self.rows, block_size):
+            for first_column in range(0, self.columns, block_size):
+                yield first_row, first_column, min(block_size, self.rows - first_row), min(block_size, self.columns - first_column)
+
+    def read_window(self, raster: any, window: tuple, nodata_to_value: float = 0) -> np.ndarray:
+        """Reads the part of the raster inside the window, filling the cells outside the raster with nodata_to_value.
+        The raster cells must have the size of the grid cells
+            Returns:
+                np.ndarray: (bands, rows, columns) array, with the pixel type of the raster. None if the raster is outside the window
+        """
+        first_row, first_column, rows, columns = window
+        # Window position in the cells of the raster
+        raster_first_column = int(round((self.xmin - raster.extent.XMin)/self.cell_width)) + first_column
+        raster_first_row = int(round((raster.extent.YMax - self.ymax)/self.cell_height)) + first_row
+        read_first_column, read_first_row = max(raster_first_column, 0), max(raster_first_row, 0)
+        read_last_column = min(raster_first_column + columns, raster.width)
+        read_last_row = min(raster_first_row + rows, raster.height)
+        if read_last_column <= read_first_column or read_last_row <= read_first_row:
+            return None
+
+        lower_left_corner = Point(
+            raster.extent.XMin + read_first_column*self.cell_width,
+            raster.extent.YMax - read_last_row*self.cell_height
+        )
+        data = read_array(raster, lower_left_corner, read_last_column - read_first_column, read_last_row - read_first_row, nodata_to_value)
+        data = data.reshape((raster.bandCount, read_last_row - read_first_row, read_last_column - read_first_column))
+        if data.shape[1:] == (rows, columns):
+            return data
+
+        block = np.full((raster.bandCount, rows, columns), nodata_to_value, dtype=data.dtype)
+        block_first_row, block_first_column = read_first_row - raster_first_row, read_first_column - raster_first_column
+        block[
+            :,
+            block_first_row:block_first_row + data.shape[1],
+            block_first_column:block_first_column + data.shape[2]
+        ] = data
+        return block
+
+
+class BlockWriter:
+    """Writes the windows of a grid straight into a single raster, created once with the grid extent,
+    cell size and spatial reference, which is saved to the output when closed"""
+
+    def __init__(self, grid: RasterGrid, output: str, band_count: int, pixel_type: str = 'U8', nodata: float = 0) -> None:
+        """
+            Args:
+                grid (RasterGrid): Cells of the output raster
+                output (str): Path of the output raster
+                band_count (int): Bands of the output raster
+                pixel_type (str, optional): RasterInfo pixel type. Defaults to 'U8'.
+                nodata (float, optional): NoData value of the output raster. Defaults to 0.
+        """
+        self.grid = grid
+        self.output = output
+        raster_info = RasterInfo()
+        raster_info.setSpatialReference(grid.spatial_reference)
+        raster_info.setExtent(grid.extent)
+        raster_info.setCellSize((grid.cell_width, grid.cell_height))
+        raster_info.setBandCount(band_count)
+        raster_info.setPixelType(pixel_type)
+        raster_info.setNoDataValues(nodata)
+        self.raster = Raster(raster_info)
+
+    def __enter__(self) -> 'BlockWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+
+    def write(self, window: tuple, block: np.ndarray) -> None:
+        """Writes a (bands, rows, columns) block at the window position"""
+        first_row, first_column = window[:2]
+        # Raster.write takes (rows, columns, bands) arrays, placed by the (row, column) of their upper left cell
+        self.raster.write(np.moveaxis(block, 0, -1) if block.shape[0] > 1 else block[0], (first_row, first_column))
+
+    def close(self) -> str:
+        self.raster.save(self.output)
+        return self.output
+
+
+def stretch_raster(raster_path: str, output: str, block_size: int = 2048, num_stddev: float = 2, max_workers: int = 4) -> str:
+    """StdDev stretch to 8 bits computed with NumPy: a first pass over the raster windows merges the
+    statistics of each band, a second one stretches the windows on a thread pool and writes them to output"""
+    raster = Raster(raster_path)
+    grid = RasterGrid.from_raster(raster)
+    nodata = raster.noDataValue
+
+    def read_blocks() -> Iterator[tuple]:
+        # arcpy reads stay on the calling thread, only the NumPy work goes to the pool
+        for window in grid.windows(block_size=block_size):
+            yield window, grid.read_window(raster=raster, window=window, nodata_to_value=nodata if nodata is not None else 0)
+
+    statistics = BandStatistics(band_count=raster.bandCount)
+    for block_statistics in map_blocks(lambda block: BandStatistics.from_block(block=block[1], nodata=nodata), read_blocks(), max_workers=max_workers):
+        statistics.merge(block_statistics)
+    mean, std = statistics.mean, statistics.std
+
+    with BlockWriter(grid=grid, output=output, band_count=raster.bandCount) as writer:
+        for window, stretched_block in map_blocks(
+            lambda block: (block[0], stretch_block(block=block[1], mean=mean, std=std, num_stddev=num_stddev, nodata=nodata)),
+            read_blocks(),
+            max_workers=max_workers
+        ):
+            writer.write(window=window, block=stretched_block)
+    return output
+
+
+class FusedRasterPipeline:
+    """Mosaic (MAXIMUM) → area of interest mask → StdDev stretch of a set of tile images, computed window by window
+    in memory. Only the final 8 bit image is written, the mosaic and the masked mosaic are optional outputs.
+    The tiles must share a spatial reference and cell alignment, and 0 is their NoData value"""
+    mosaic_nodata: int = 0
+    mosaic_pixel_type: type = np.uint16 # Of the windows no tile overlaps
+
+    def __init__(
+            self,
+            sources: list,
+            mask: str = None,
+            cell_size: float = None,
+            block_size: int = 2048,
+            num_stddev: float = 2,
+            max_workers: int = 4,
+            temp_folder: str = None,
+            clip_extent: Extent = None
+        ) -> None:
+        """
+            Args:
+                sources (list): Paths of the tile images, or their BandStack
+                mask (str, optional): Area of interest feature, cells outside of it become NoData. Defaults to None.
+                cell_size (float, optional): Output cell size. Defaults to the cell size of the first source.
+                block_size (int, optional): Rows and columns of each window. Defaults to 2048.
+                num_stddev (float, optional): Standard deviations mapped to 1-255 by the stretch. Defaults to 2.
+                max_workers (int, optional): Threads of the NumPy work. Defaults to 4.
+                temp_folder (str, optional): Folder of the rasterized mask. Defaults to the system temp folder.
+                clip_extent (Extent, optional): Only the cells inside it are read and written, in the spatial reference of the first source. Defaults to None.
+        """
+        self.rasters = [source if isinstance(source, BandStack) else Raster(source) for source in sources]
+        self.mask = mask
+        self.grid = RasterGrid.from_rasters(rasters=self.rasters, cell_size=cell_size)
+        if clip_extent:
+            self.grid = self.grid.clip(extent=clip_extent, margin_cells=1)
+        self.band_count = max(raster.bandCount for raster in self.rasters)
+        self.block_size = block_size
+        self.num_stddev = num_stddev
+        self.max_workers = max_workers
+        self.temp_folder = temp_folder
+
+    def _rasterize_mask(self, folder: str) -> Raster:
+        """Mask raster aligned to the grid: the feature OID inside the area of interest, NoData outside.
+        Shapefile FIDs start at 0, so only the NoData cells are outside the area of interest"""
+        mask_raster = os.path.join(folder, 'mask.tif')
+        with EnvManager(
+            extent=self.grid.extent,
+            outputCoordinateSystem=self.grid.spatial_reference,
+            cellSize=self.grid.cell_width
+        ):
+            FeatureToRaster(self.mask, Describe(self.mask).OIDFieldName, mask_raster, self.grid.cell_width)
+        return Raster(mask_raster)
+
+    def _read_blocks(self, mask_raster: Raster = None) -> Iterator[tuple]:
+        for window in self.grid.windows(block_size=self.block_size):
+            # Tiles outside the window aren't read (nor allocated)
+            tiles = [self.grid.read_window(raster=raster, window=window, nodata_to_value=self.mosaic_nodata) for raster in self.rasters]
+            tiles = [tile for tile in tiles if tile is not None]
+            mask = None
+            if mask_raster:
+                mask_nodata = mask_raster.noDataValue if mask_raster.noDataValue is not None else -1
+                mask_block = self.grid.read_window(raster=mask_raster, window=window, nodata_to_value=mask_nodata)
+                mask = mask_block[0] != mask_nodata if mask_block is not None else np.zeros(window[2:], dtype=bool)
+            yield window, tiles, mask
+
+    def _compose_block(self, window: tuple, tiles: list, mask: np.ndarray = None) -> tuple:
+        """Mosaic (MAXIMUM) of the tiles windows and the same mosaic with the cells outside the mask as NoData.
+        Both keep the pixel type of the tiles, only the stretch works in floating point"""
+        pixel_type = np.result_type(*tiles) if tiles else self.mosaic_pixel_type
+        mosaic = np.full((self.band_count, *window[2:]), self.mosaic_nodata, dtype=pixel_type)
+        for tile in tiles:
+            mosaic[:tile.shape[0]] = np.maximum(mosaic[:tile.shape[0]], tile)
+        masked_mosaic = np.where(mask[None, :, :], mosaic, self.mosaic_nodata) if mask is not None else mosaic
+        return mosaic, masked_mosaic
+
+    def _get_block_statistics(self, window: tuple, tiles: list, mask: np.ndarray = None) -> tuple:
+        blocks = self._compose_block(window=window, tiles=tiles, mask=mask)
+        return blocks, BandStatistics.from_block(block=blocks[1], nodata=self.mosaic_nodata)
+
+    def _stretch_block(self, window: tuple, tiles: list, mask: np.ndarray, mean: np.ndarray, std: np.ndarray) -> np.ndarray:
+        mosaic, masked_mosaic = self._compose_block(window=window, tiles=tiles, mask=mask)
+        return stretch_block(block=masked_mosaic, mean=mean, std=std, num_stddev=self.num_stddev, nodata=self.mosaic_nodata)
+
+    def run(self, output: str, mosaic_output: str = None, masked_output: str = None) -> str:
+        """Writes the stretched image to output
+            Args:
+                output (str): Path of the final 8 bit image
+                mosaic_output (str, optional): Path to also write the mosaic to (16 bits). Defaults to None.
+                masked_output (str, optional): Path to also write the masked mosaic to (16 bits). Defaults to None.
+            Returns:
+                str: output
+        """
+        work_folder = tempfile.mkdtemp(prefix='pipeline_', dir=self.temp_folder if self.temp_folder and os.path.isdir(self.temp_folder) else None)
+        try:
+            mask_raster = self._rasterize_mask(folder=work_folder) if self.mask else None
+
+            statistics = BandStatistics(band_count=self.band_count)
+            intermediate_writers = [
+                (index, BlockWriter(grid=self.grid, output=path, band_count=self.band_count, pixel_type='U16'))
+                for index, path in enumerate([mosaic_output, masked_output]) if path
+            ]
+            for window, blocks, block_statistics in map_blocks(
+                lambda block: (block[0], *self._get_block_statistics(window=block[0], tiles=block[1], mask=block[2])),
+                self._read_blocks(mask_raster=mask_raster),
+                max_workers=self.max_workers
+            ):
+                statistics.merge(block_statistics)
+                for index, writer in intermediate_writers:
+                    writer.write(window=window, block=blocks[index].astype(np.uint16, copy=False))
+            for index, writer in intermediate_writers:
+                writer.close()
+            mean, std = statistics.mean, statistics.std
+
+            with BlockWriter(grid=self.grid, output=output, band_count=self.band_count) as writer:
+                for window, stretched_block in map_blocks(
+                    lambda block: (block[0], self._stretch_block(window=block[0], tiles=block[1], mask=block[2], mean=mean, std=std)),
+                    self._read_blocks(mask_raster=mask_raster),
+                    max_workers=self.max_workers
+                ):
+                    writer.write(window=window, block=stretched_block)
+        finally:
+            shutil.rmtree(work_folder, ignore_errors=True)
+        return output
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+import random
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
+from threading import Lock
+from urllib.parse import urlparse
+
+from core._logs import *
+from requests.exceptions import ChunkedEncodingError, ConnectionError, Timeout
+from sentinelsat.exceptions import ServerError as SetinelServerError
+from urllib3.exceptions import ProtocolError
+
+from .CustomExceptions import CircuitOpenError, MaxFailuresError
+
+
+class RetryPolicy:
+    """Original retry behaviour of prevent_server_error: every error is retried,
+    waiting wait_time_seconds longer after each failed attempt"""
+    max_failures: int = MaxFailuresError.max_failures
+    wait_time_seconds: int = MaxFailuresError.wait_time_seconds
+
+    def get_host(self, args: tuple, kwargs: dict) -> str:
+        return None
+
+    def before_attempt(self, host: str) -> None:
+        pass
+
+    def record_success(self, host: str) -> None:
+        pass
+
+    def record_failure(self, host: str, error: Exception) -> None:
+        pass
+
+    def is_retryable(self, error: Exception) -> bool:
+        return True
+
+    def get_wait_time(self, failed_attempts: int, error: Exception) -> float:
+        return failed_attempts*self.wait_time_seconds
+
+
+class CircuitBreaker:
+    """Keeps track of consecutive server failures per host. Once a host reaches failure_threshold,
+    its circuit opens and calls fail fast until reset_timeout_seconds have passed. Then a single
+    trial call is let through: a success closes the circuit and a failure opens it again"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout_seconds: int = 5*60) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self._failures = {}
+        self._opened_at = {}
+        self._trial_in_progress = set()
+        self._lock = Lock()
+
+    def is_open(self, host: str) -> bool:
+        with self._lock:
+            return host in self._opened_at
+
+    def before_call(self, host: str) -> None:
+        with self._lock:
+            opened_at = self._opened_at.get(host)
+            if opened_at is None:
+                return
+            if time.monotonic() - opened_at < self.reset_timeout_seconds or host in self._trial_in_progress:
+                raise CircuitOpenError(host=host)
+            self._trial_in_progress.add(host)
+
+    def record_success(self, host: str) -> None:
+        with self._lock:
+            self._failures.pop(host, None)
+            self._opened_at.pop(host, None)
+            self._trial_in_progress.discard(host)
+
+    def record_failure(self, host: str) -> None:
+        with self._lock:
+            self._failures[host] = self._failures.get(host, 0) + 1
+            if host in self._trial_in_progress or self._failures[host] >= self.failure_threshold:
+                if host not in self._opened_at or host in self._trial_in_progress:
+                    aprint(f'Servidor {host} indisponível, novas requisições serão recusadas por {self.reset_timeout_seconds} segundos', level=LogLevels.WARNING)
+                self._opened_at[host] = time.monotonic()
+                self._trial_in_progress.discard(host)
+
+
+class BackoffRetryPolicy(RetryPolicy):
+    """Exponential backoff with full jitter, honouring the Retry-After header of 429/503 responses.
+    Client errors other then 408/429 aren't retried and, when a circuit breaker is given,
+    server failures are counted per host so a host that is down fails fast"""
+    base_wait_time_seconds: float = 2
+    max_wait_time_seconds: float = 10*60
+    retry_after_status_codes: list = [HTTPStatus.TOO_MANY_REQUESTS.value, HTTPStatus.SERVICE_UNAVAILABLE.value]
+    retryable_client_status_codes: list = [HTTPStatus.REQUEST_TIMEOUT.value, HTTPStatus.TOO_MANY_REQUESTS.value]
+
+    def __init__(self, max_failures: int = None, circuit_breaker: CircuitBreaker = None) -> None:
+        if max_failures is not None:
+            self.max_failures = max_failures
+        self.circuit_breaker = circuit_breaker
+
+    def get_host(self, args: tuple, kwargs: dict) -> str:
+        """Host of the `url` or `api` argument, or of the `service_url` of the decorated method's instance"""
+        url = kwargs.get('url')
+        if not url and hasattr(kwargs.get('api'), 'api_url'):
+            url = kwargs.get('api').api_url
+        if not url and args:
+            url = getattr(args[0], 'service_url', None)
+        if url:
+            return urlparse(url).netloc or url
+
+    def before_attempt(self, host: str) -> None:
+        if self.circuit_breaker and host:
+            self.circuit_breaker.before_call(host)
+
+    def record_success(self, host: str) -> None:
+        if self.circuit_breaker and host:
+            self.circuit_breaker.record_success(host)
+
+    def record_failure(self, host: str, error: Exception) -> None:
+        if not self.circuit_breaker or not host:
+            return
+        if not self.is_server_error(error):
+            # The host answered, whatever went wrong with this request
+            self.circuit_breaker.record_success(host)
+            return
+        self.circuit_breaker.record_failure(host)
+        if self.circuit_breaker.is_open(host):
+            raise CircuitOpenError(host=host, error=error)
+
+    @staticmethod
+    def _get_status_code(error: Exception) -> int:
+        response = getattr(error, 'response', None)
+        return getattr(response, 'status_code', None)
+
+    def is_server_error(self, error: Exception) -> bool:
+        # Connections dropped in the middle of a response are server failures too
+        if isinstance(error, (ConnectionError, Timeout, ChunkedEncodingError, ProtocolError, SetinelServerError)):
+            return True
+        status_code = self._get_status_code(error)
+        return status_code is not None and (status_code >= 500 or status_code == HTTPStatus.TOO_MANY_REQUESTS.value)
+
+    def is_retryable(self, error: Exception) -> bool:
+        status_code = self._get_status_code(error)
+        if status_code is not None and 400 <= status_code < 500:
+            return status_code in self.retryable_client_status_codes
+        return True
+
+    def get_wait_time(self, failed_attempts: int, error: Exception) -> float:
+        retry_after = self._get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_wait_time_seconds)
+        backoff = min(self.max_wait_time_seconds, self.base_wait_time_seconds*2**(failed_attempts - 1))
+        return random.uniform(0, backoff)
+
+    def _get_retry_after(self, error: Exception) -> float:
+        """Reads Retry-After, either in seconds or as an HTTP date"""
+        response = getattr(error, 'response', None)
+        if getattr(response, 'status_code', None) not in self.retry_after_status_codes:
+            return None
+        retry_after = response.headers.get('Retry-After') if response.headers else None
+        if not retry_after:
+            return None
+        if retry_after.strip().isdigit():
+            return float(retry_after)
+        try:
+            retry_date = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        if retry_date.tzinfo is None:
+            retry_date = retry_date.replace(tzinfo=timezone.utc)
+        return max(0, (retry_date - datetime.now(timezone.utc)).total_seconds())
+
+
+# Shared by every download so a host that is down trips a single circuit for all workers
+host_circuit_breaker = CircuitBreaker()
+
+# Searches keep retrying while a host is down: a failed search would leave the whole run without images
+QUERY_RETRY_POLICY = BackoffRetryPolicy()
+DOWNLOAD_RETRY_POLICY = BackoffRetryPolicy(circuit_breaker=host_circuit_breaker)
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import date, datetime, timedelta
+
+from core._logs import *
+
+
+class SceneRecord:
+    """Catalogued scene, keeping as attributes only what the ranking and the download of the scene use.
+    The full feature (footprint and every property returned by the API) stays as the JSON text it is
+    stored with, and is only decoded when accessed"""
+    __slots__ = ('scene_id', 'tile', 'datetime', 'title', 'filename', 'cloud_cover', 'nodata_pixel_percentage', 'assets', 'sources', '_feature')
+
+    def __init__(
+            self,
+            scene_id: str,
+            tile: str,
+            datetime: datetime,
+            feature: any,
+            title: str = None,
+            filename: str = None,
+            cloud_cover: float = None,
+            nodata_pixel_percentage: float = None,
+            assets: dict = None,
+            sources: list = None
+        ) -> None:
+        """
+            Args:
+                scene_id (str): Scene id on the provider
+                tile (str): Tile name
+                datetime (datetime): Acquisition date
+                feature (any): GeoJSON feature of the scene, as a dict or already serialized
+                title (str, optional): Product title. Defaults to None.
+                filename (str, optional): Product file name. Defaults to None.
+                cloud_cover (float, optional): Cloud cover percentage. Defaults to None.
+                nodata_pixel_percentage (float, optional): Nodata percentage, when already known. Defaults to None.
+                assets (dict, optional): Download links. Defaults to None.
+                sources (list, optional): Accounts that found the scene. Defaults to None.
+        """
+        self.scene_id = str(scene_id)
+        self.tile = str(tile)
+        self.datetime = datetime
+        self.title = title
+        self.filename = filename
+        self.cloud_cover = cloud_cover
+        self.nodata_pixel_percentage = nodata_pixel_percentage
+        self.assets = assets if assets else {}
+        self.sources = sources if sources else []
+        self._feature = feature if isinstance(feature, str) else json.dumps(feature)
+
+    def __repr__(self):
+        return f'{self.tile}_{self.datetime}'
+
+    @property
+    def feature(self) -> dict:
+        return json.loads(self._feature)
+
+    @property
+    def properties(self) -> dict:
+        return self.feature.get('properties') or {}
+
+    @property
+    def footprint(self) -> dict:
+        return self.feature.get('geometry')
+
+
+class SceneCatalog:
+    """Local SQLite catalog of the scenes returned by the imagery services.
+    Besides the scenes, it records which date ranges were already queried for each sensor, tile and
+    query area, so a new search of the same area only asks the remote API for the ranges it hasn't covered yet.
+    Ranges newer than the ingestion lag are never marked as covered, because the providers
+    keep publishing scenes of those days for a while"""
+    date_format: str = '%Y-%m-%dT%H:%M:%S'
+    timeout_seconds: int = 60 # Other runs may be writing to the same file
+
+    def __init__(self, path: str, ingestion_lag_days: int = 3) -> None:
+        self.path = path
+        self.ingestion_lag_days = ingestion_lag_days
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._create_tables()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=self.timeout_seconds)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _create_tables(self) -> None:
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS scenes (
+                    sensor TEXT NOT NULL,
+                    scene_id TEXT NOT NULL,
+                    tile TEXT NOT NULL,
+                    datetime TEXT NOT NULL,
+                    cloud_cover REAL,
+                    nodata_pixel_percentage REAL,
+                    footprint TEXT,
+                    assets TEXT,
+                    sources TEXT,
+                    feature TEXT NOT NULL,
+                    title TEXT,
+                    filename TEXT,
+                    PRIMARY KEY (sensor, scene_id)
+                )
+            ''')
+            connection.execute('CREATE INDEX IF NOT EXISTS scenes_tile_datetime ON scenes (sensor, tile, datetime)')
+            connection.execute('''
+                CREATE TABLE IF NOT EXISTS coverage (
+                    sensor TEXT NOT NULL,
+                    tile TEXT NOT NULL,
+                    max_cloud_coverage REAL NOT NULL,
+                    begin_date TEXT NOT NULL,
+                    end_date TEXT NOT NULL,
+                    area TEXT
+                )
+            ''')
+            connection.execute('CREATE INDEX IF NOT EXISTS coverage_tile ON coverage (sensor, tile)')
+            # Catalogs created by previous versions don't have the newer columns
+            self._add_missing_columns(connection=connection, table='scenes', columns={'title': 'TEXT', 'filename': 'TEXT'})
+            self._add_missing_columns(connection=connection, table='coverage', columns={'area': 'TEXT'})
+        connection.close()
+
+    @staticmethod
+    def _add_missing_columns(connection: sqlite3.Connection, table: str, columns: dict) -> None:
+        existing_columns = [row['name'] for row in connection.execute(f'PRAGMA table_info({table})').fetchall()]
+        for column, column_type in columns.items():
+            if column not in existing_columns:
+                connection.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+    @staticmethod
+    def _get_area_key(area: any) -> str:
+        """Hash of the area sent to the remote API (WKT, bbox...), coverage is only reused by searches of the same area"""
+        if not isinstance(area, str):
+            area = json.dumps(area)
+        return hashlib.sha1(area.encode('utf-8')).hexdigest()
+
+    def _to_str(self, value: datetime) -> str:
+        if not isinstance(value, datetime) and isinstance(value, date):
+            value = datetime.combine(value, datetime.min.time())
+        return value.strftime(self.date_format)
+
+    def _to_datetime(self, value: any) -> datetime:
+        if isinstance(value, str):
+            return datetime.strptime(value, self.date_format)
+        if not isinstance(value, datetime) and isinstance(value, date):
+            return datetime.combine(value, datetime.min.time())
+        return value
+
+    @staticmethod
+    def _merge_ranges(ranges: list) -> list:
+        merged_ranges = []
+        for begin_date, end_date in sorted(ranges):
+            if merged_ranges and begin_date <= merged_ranges[-1][1]:
+                merged_ranges[-1] = (merged_ranges[-1][0], max(merged_ranges[-1][1], end_date))
+            else:
+                merged_ranges.append((begin_date, end_date))
+        return merged_ranges
+
+    @staticmethod
+    def _subtract_ranges(begin_date: datetime, end_date: datetime, covered_ranges: list) -> list:
+        missing_ranges = []
+        current_date = begin_date
+        for covered_begin, covered_end in covered_ranges:
+            if covered_end <= current_date:
+                continue
+            if covered_begin >= end_date:
+                break
+            if covered_begin > current_date:
+                missing_ranges.append((current_date, covered_begin))
+            current_date = max(current_date, covered_end)
+        if current_date < end_date:
+            missing_ranges.append((current_date, end_date))
+        return missing_ranges
+
+    def get_missing_ranges(self, sensor: str, tiles: list, area: any, begin_date: datetime, end_date: datetime, max_cloud_coverage: float) -> list:
+        """Lists the date ranges that still have to be queried, so every tile is covered from begin_date to end_date
+            Args:
+                sensor (str): Sensor name
+                tiles (list): Tiles of the area of interest
+                area (any): Area of the remote query, ranges queried for other areas don't count
+                begin_date (datetime): Search start
+                end_date (datetime): Search end
+                max_cloud_coverage (float): Cloud cover filter of the search, ranges queried with a stricter filter don't count
+            Returns:
+                list: [(begin_date, end_date), ...] ranges to be queried, merged across tiles
+        """
+        begin_date, end_date = self._to_datetime(begin_date), self._to_datetime(end_date)
+        missing_ranges = []
+        with self._connect() as connection:
+            for tile in tiles:
+                rows = connection.execute(
+                    'SELECT begin_date, end_date FROM coverage WHERE sensor = ? AND tile = ? AND area = ? AND max_cloud_coverage >= ?',
+                    (sensor, tile, self._get_area_key(area), max_cloud_coverage)
+                ).fetchall()
+                covered_ranges = self._merge_ranges([
+                    (self._to_datetime(row['begin_date']), self._to_datetime(row['end_date'])) for row in rows
+                ])
+                missing_ranges.extend(self._subtract_ranges(begin_date, end_date, covered_ranges))
+        connection.close()
+        return self._merge_ranges(missing_ranges)
+
+    def add_coverage(self, sensor: str, tiles: list, area: any, begin_date: datetime, end_date: datetime, max_cloud_coverage: float) -> None:
+        """Records that the range was queried, over area, for every tile, up to the ingestion lag"""
+        begin_date = self._to_datetime(begin_date)
+        end_date = min(self._to_datetime(end_date), datetime.now() - timedelta(days=self.ingestion_lag_days))
+        if end_date <= begin_date:
+            return
+        area_key = self._get_area_key(area)
+        with self._connect() as connection:
+            connection.executemany(
+                'INSERT INTO coverage (sensor, tile, max_cloud_coverage, begin_date, end_date, area) VALUES (?, ?, ?, ?, ?, ?)',
+                [(sensor, tile, max_cloud_coverage, self._to_str(begin_date), self._to_str(end_date), area_key) for tile in tiles]
+            )
+        connection.close()
+
+    def put_scenes(self, sensor: str, scenes: list) -> None:
+        """Adds or updates scenes (SceneRecord), keeping the nodata percentage already stored for them"""
+        if not scenes:
+            return
+        with self._connect() as connection:
+            connection.executemany(
+                '''
+                INSERT INTO scenes (sensor, scene_id, tile, datetime, title, filename, cloud_cover, footprint, assets, sources, feature)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (sensor, scene_id) DO UPDATE SET
+                    tile = excluded.tile,
+                    datetime = excluded.datetime,
+                    title = excluded.title,
+                    filename = excluded.filename,
+                    cloud_cover = excluded.cloud_cover,
+                    footprint = excluded.footprint,
+                    assets = excluded.assets,
+                    sources = excluded.sources,
+                    feature = excluded.feature
+                ''',
+                [
+                    (
+                        sensor,
+                        scene.scene_id,
+                        scene.tile,
+                        self._to_str(scene.datetime),
+                        scene.title,
+                        scene.filename,
+                        scene.cloud_cover,
+                        json.dumps(scene.footprint),
+                        json.dumps(scene.assets),
+                        json.dumps(scene.sources),
+                        scene._feature
+                    ) for scene in scenes
+                ]
+            )
+        connection.close()
+
+    def set_nodata_pixel_percentages(self, sensor: str, nodata_pixel_percentages: dict) -> None:
+        """Stores the nodata percentage of already catalogued scenes
+            Args:
+                sensor (str): Sensor name
+                nodata_pixel_percentages (dict): Scene id -> nodata percentage
+        """
+        if not nodata_pixel_percentages:
+            return
+        with self._connect() as connection:
+            connection.executemany(
+                'UPDATE scenes SET nodata_pixel_percentage = ? WHERE sensor = ? AND scene_id = ?',
+                [(value, sensor, str(scene_id)) for scene_id, value in nodata_pixel_percentages.items()]
+            )
+        connection.close()
+
+    def get_scenes(self, sensor: str, tiles: list, begin_date: datetime, end_date: datetime, max_cloud_coverage: float = None) -> list:
+        """Lists, as SceneRecord, the catalogued scenes of the tiles taken between begin_date and end_date"""
+        if not tiles:
+            return []
+        query = f'''
+            SELECT scene_id, tile, datetime, title, filename, cloud_cover, nodata_pixel_percentage, assets, sources, feature FROM scenes
+            WHERE sensor = ? AND tile IN ({','.join('?'*len(tiles))}) AND datetime >= ? AND datetime < ?
+        '''
+        parameters = [sensor, *[str(tile) for tile in tiles], self._to_str(begin_date), self._to_str(end_date)]
+        if max_cloud_coverage is not None:
+            query += ' AND (cloud_cover IS NULL OR cloud_cover <= ?)'
+            parameters.append(max_cloud_coverage)
+
+        with self._connect() as connection:
+            rows = connection.execute(query, parameters).fetchall()
+        connection.close()
+
+        return [self._to_record(row) for row in rows]
+
+    def _to_record(self, row: sqlite3.Row) -> SceneRecord:
+        record = SceneRecord(
+            scene_id=row['scene_id'],
+            tile=row['tile'],
+            datetime=self._to_datetime(row['datetime']),
+            feature=row['feature'], # Decoded only if the properties or the footprint are needed
+            title=row['title'],
+            filename=row['filename'],
+            cloud_cover=row['cloud_cover'],
+            nodata_pixel_percentage=row['nodata_pixel_percentage'],
+            assets=json.loads(row['assets']) if row['assets'] else {},
+            sources=json.loads(row['sources']) if row['sources'] else []
+        )
+        if record.title is None:
+            # Scenes catalogued before the title and filename columns existed
+            properties = record.properties
+            record.title = properties.get('title')
+            record.filename = properties.get('filename')
+        return record
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+import hashlib
+import json
+import math
+import os
+import pickle
+
+from arcpy import AsShape, Describe, SpatialReference
+from arcpy.da import SearchCursor
+from core._logs import *
+
+
+class TileIndex:
+    """Uniform grid over the bounding boxes of a tile grid layer (Sentinel/CBERS), keeping the tile polygons
+    for the exact intersection test of the candidates found in the grid.
+    The index is pickled and only rebuilt when the database holding the layer changes"""
+    version: int = 1 # Pickles of other versions are rebuilt
+
+    def __init__(self, tiles: list, spatial_reference: str) -> None:
+        """
+            Args:
+                tiles (list): [(name, (xmin, ymin, xmax, ymax), esri json polygon), ...]
+                spatial_reference (str): Spatial reference string of the tiles layer
+        """
+        self.tiles = tiles
+        self.spatial_reference = spatial_reference
+        self.cell_size = self._get_cell_size(tiles)
+        self.cells = {}
+        for index, (name, extent, polygon) in enumerate(tiles):
+            for cell in self._get_cells(extent):
+                self.cells.setdefault(cell, []).append(index)
+        self._polygons = {}
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['_polygons'] = {} # arcpy geometries can't be pickled, they are recreated on demand
+        return state
+
+    @staticmethod
+    def _get_cell_size(tiles: list) -> float:
+        if not tiles:
+            return 1
+        sizes = [max(extent[2] - extent[0], extent[3] - extent[1]) for name, extent, polygon in tiles]
+        return max(sum(sizes)/len(sizes), 1e-9)
+
+    def _get_cells(self, extent: tuple) -> list:
+        xmin, ymin, xmax, ymax = extent
+        columns = range(math.floor(xmin/self.cell_size), math.floor(xmax/self.cell_size) + 1)
+        rows = range(math.floor(ymin/self.cell_size), math.floor(ymax/self.cell_size) + 1)
+        return [(column, row) for column in columns for row in rows]
+
+    def _get_polygon(self, index: int) -> any:
+        if index not in self._polygons:
+            self._polygons[index] = AsShape(json.loads(self.tiles[index][2]), True)
+        return self._polygons[index]
+
+    def query(self, geometry: any) -> list:
+        """Names of the tiles intersecting the geometry, which must be in the spatial reference of the index"""
+        extent = (geometry.extent.XMin, geometry.extent.YMin, geometry.extent.XMax, geometry.extent.YMax)
+        candidates = set()
+        for cell in self._get_cells(extent):
+            candidates.update(self.cells.get(cell, []))
+
+        tile_names = []
+        for index in sorted(candidates):
+            name, (xmin, ymin, xmax, ymax), polygon = self.tiles[index]
+            if xmax < extent[0] or xmin > extent[2] or ymax < extent[1] or ymin > extent[3]:
+                continue
+            if not self._get_polygon(index).disjoint(geometry):
+                tile_names.append(name)
+        return tile_names
+
+    def get_spatial_reference(self) -> SpatialReference:
+        spatial_reference = SpatialReference()
+        spatial_reference.loadFromString(self.spatial_reference)
+        return spatial_reference
+
+    def get_tile_polygon(self, tile_name: str) -> any:
+        """Polygon of the tile, in the spatial reference of the index"""
+        for index, (name, extent, polygon) in enumerate(self.tiles):
+            if name == str(tile_name):
+                return self._get_polygon(index)
+
+    def read_geometry(self, feature: str, where_clause: str = None) -> any:
+        """Union of the feature geometries, projected to the spatial reference of the index"""
+        geometry = None
+        for row in SearchCursor(feature, ['SHAPE@'], where_clause=where_clause, spatial_reference=self.get_spatial_reference()):
+            if not row[0]:
+                continue
+            geometry = geometry.union(row[0]) if geometry else row[0]
+        return geometry
+
+    def get_intersecting_tiles(self, feature: str, where_clause: str = None) -> list:
+        """Names of the tiles intersecting the feature
+            Args:
+                feature (str): Feature class path (area of interest)
+                where_clause (str, optional): Filter of the feature geometries. Defaults to None.
+            Returns:
+                list: Tile names
+        """
+        geometry = self.read_geometry(feature=feature, where_clause=where_clause)
+        return self.query(geometry) if geometry else []
+
+    @classmethod
+    def build(cls, layer: str, name_field: str) -> 'TileIndex':
+        tiles = []
+        for name, shape in SearchCursor(layer, [name_field, 'SHAPE@']):
+            if not shape:
+                continue
+            extent = (shape.extent.XMin, shape.extent.YMin, shape.extent.XMax, shape.extent.YMax)
+            tiles.append((str(name), extent, shape.JSON))
+        return cls(tiles=tiles, spatial_reference=Describe(layer).spatialReference.exportToString())
+
+    @staticmethod
+    def get_fingerprint(database: str) -> str:
+        """Changes whenever a file of the database (.gdb folder) is added, removed or modified"""
+        fingerprint = hashlib.sha1()
+        for path, dirs, files in sorted(os.walk(database)):
+            for file in sorted(files):
+                if file.endswith('.lock'):
+                    continue # Lock files come and go with every reader
+                stat = os.stat(os.path.join(path, file))
+                fingerprint.update(f'{os.path.relpath(os.path.join(path, file), database)}|{stat.st_size}|{stat.st_mtime_ns}'.encode())
+        return fingerprint.hexdigest()
+
+    @classmethod
+    def load(cls, layer: str, name_field: str, database: str, cache_file: str) -> 'TileIndex':
+        """Loads the pickled index of the layer, rebuilding it if the database changed since it was built"""
+        fingerprint = cls.get_fingerprint(database)
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'rb') as cached_index:
+                    cached = pickle.load(cached_index)
+                if cached.get('version') == cls.version and cached.get('fingerprint') == fingerprint:
+                    return cached.get('index')
+            except Exception as e:
+                aprint(f'Índice de tiles {cache_file} inválido, recriando.\n{e}', level=LogLevels.WARNING)
+
+        index = cls.build(layer=layer, name_field=name_field)
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        temp_file = f'{cache_file}.{os.getpid()}.tmp'
+        with open(temp_file, 'wb') as cached_index:
+            pickle.dump({'version': cls.version, 'fingerprint': fingerprint, 'index': index}, cached_index)
+        os.replace(temp_file, cache_file)
+        return index
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from core._logs import *
+from core.instances.Feature import Feature
+
+from .ImageryServices import BaseImageAcquisitionService
+
+
+class AsyncAcquisitionEngine:
+    """Acquires every tile of an area of interest on an asyncio event loop.
+    The images of all tiles are chosen concurrently, each tile starts downloading as soon as its
+    best images are chosen and the composition (arcpy) runs on a dedicated executor,
+    overlapping with the downloads of the other tiles"""
+
+    def __init__(self, service: BaseImageAcquisitionService, max_workers: int = 4) -> None:
+        self.service = service
+        self.max_workers = max_workers
+
+    def acquire(self, tile_names: list, area_of_interest: Feature = None, on_tile_completed: callable = None) -> list:
+        """Acquires all tiles and returns the results in the same format as get_best_available_images_for_tile
+            Args:
+                tile_names (list): Tiles to be acquired
+                area_of_interest (Feature, optional): Used if the service still has to query its images. Defaults to None.
+                on_tile_completed (callable, optional): Called, with the tile result, as each tile finishes. Defaults to None.
+            Returns:
+                list: [{'images': [...], 'tile': tile_name}, ...]
+        """
+        return asyncio.run(
+            self._acquire(
+                tile_names=tile_names,
+                area_of_interest=area_of_interest,
+                on_tile_completed=on_tile_completed
+            )
+        )
+
+    async def _acquire(self, tile_names: list, area_of_interest: Feature, on_tile_completed: callable) -> list:
+        self._io_executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._composition_executor = ThreadPoolExecutor(max_workers=1) # arcpy runs one tool at a time
+        tasks = [
+            asyncio.ensure_future(self._acquire_tile(tile_name=tile_name, area_of_interest=area_of_interest))
+            for tile_name in tile_names
+        ]
+        try:
+            results = []
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                results.append(result)
+                if on_tile_completed:
+                    on_tile_completed(result)
+            return results
+        except BaseException:
+            # A failed tile stops the others: queued downloads and compositions never start
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            self._io_executor.shutdown(wait=True, cancel_futures=True)
+            self._composition_executor.shutdown(wait=True, cancel_futures=True)
+
+    async def _run(self, executor: ThreadPoolExecutor, method: callable, *args, **kwargs) -> any:
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(method, *args, **kwargs))
+
+    async def _acquire_tile(self, tile_name: str, area_of_interest: Feature) -> dict:
+        # Metadata the selection needs is fetched by the service itself, only for the tiles that need it
+        best_available_images = await self._run(
+            self._io_executor,
+            self.service.select_best_images_for_tile,
+            tile_name=tile_name,
+            area_of_interest=area_of_interest
+        )
+        if not best_available_images:
+            return {}
+
+        downloaded_images = await self._download_and_compose(
+            images=best_available_images,
+            output_name=self.service.get_tile_output_name(tile_name=tile_name)
+        )
+        return {'images':downloaded_images, 'tile':tile_name}
+
+    async def _download_and_compose(self, images: list, output_name: str) -> list:
+        compositions = []
+        try:
+            for image in images:
+                downloaded = await self._run(self._io_executor, self.service.download_image_bands, image=image, output_name=output_name)
+                if not downloaded:
+                    continue
+                composition = self._run(self._composition_executor, self.service.compose_tile_image, image=image)
+
+                if self.service._single_image_per_tile:
+                    # The next image is only needed if this one can't be composed
+                    if await composition:
+                        return [image]
+                    continue
+                # The next download starts while this image is composed
+                compositions.append((image, asyncio.ensure_future(composition)))
+
+            return [image for image, composition in compositions if await composition]
+        except BaseException:
+            # Compositions that didn't start are cancelled and the others awaited, so none is left behind unretrieved
+            pending_compositions = [composition for image, composition in compositions]
+            for composition in pending_compositions:
+                composition.cancel()
+            await asyncio.gather(*pending_compositions, return_exceptions=True)
+            raise
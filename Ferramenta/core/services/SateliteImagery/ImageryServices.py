@@ -3,11 +3,13 @@
 import json
 import os
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta
 from http import HTTPStatus
+from threading import Lock
+from typing import Iterator
 
 import requests
-from arcpy.da import SearchCursor
 from core._constants import *
 from core._logs import *
 from core.instances.Database import Database
@@ -15,10 +17,17 @@ from core.instances.Feature import Feature
 from core.instances.Images import CbersImage, SentinelImage
 from core.libs.Base import prevent_server_error
 from core.libs.BaseProperties import BaseProperties
-from core.libs.CustomExceptions import (NoBaseTilesLayerFound,
+from core.libs.CustomExceptions import (CircuitOpenError, ImageSearchError,
+                                        NoBaseTilesLayerFound,
                                         NoCbersCredentials,
                                         NoImageFoundForTile,
-                                        PansharpCustomException)
+                                        PansharpCustomException,
+                                        RequestRejectedError)
+from core.libs.Downloader import ResumableDownloader, create_pooled_session
+from core.libs.FootprintCoverage import FootprintCoverageSelector
+from core.libs.RetryPolicy import QUERY_RETRY_POLICY
+from core.libs.SceneCatalog import SceneRecord
+from core.libs.TileIndex import TileIndex
 from core.ml_models.ImageClassifier import (BaseImageClassifier,
                                             CbersImageClassifier,
                                             Sentinel2ImageClassifier)
@@ -34,9 +43,21 @@ class BaseImageAcquisitionService(BaseProperties):
     _days_gap: int = 30
     selected_tiles: any = None
     tiles_layer: Feature = None
+    available_images: dict = None # Candidate images of the selected window, by tile
+    searched_images: dict = None # Every image found by the last search, by tile
+    searched_window: tuple = None # (begin_date, end_date) of the last search
+    tile_names: list = []
+    tile_index: TileIndex = None
+    area_of_interest_geometry: any = None # Union of the area of interest geometries, in the tile index spatial reference
+    _single_image_per_tile: bool = False # When True, the tile keeps only the first image successfully composed
+    _min_area_of_interest_overlap: float = 1 # Minimum percentage of the tile ∩ area of interest covered by a candidate image
 
     def __init__(self, *args, **kwargs) -> None:
         super(BaseImageAcquisitionService, self).__init__(*args, **kwargs)
+        self._available_images_lock = Lock() # Tiles are acquired concurrently, only one of them may trigger the query
+        self._target_areas = {}
+        self.available_images = {}
+        self.searched_images = {}
 
         self.base_gbd = Database(path=IMAGERY_SERVICES_DIR, name=self.gdb_name)
         self.set_downloaded_images_path(path=self.download_storage)
@@ -71,6 +92,107 @@ class BaseImageAcquisitionService(BaseProperties):
     def query_available_images(self, *args, **kwargs) -> dict:
         pass
 
+    def get_search_window(self, max_date: datetime = None, days_period: int = None) -> tuple:
+        """Date range searched for images up to max_date
+            Returns:
+                tuple: (begin_date, end_date), with end_date exclusive
+        """
+        if not max_date: max_date = self.today
+        if not days_period: days_period = self._days_gap
+        return max_date - timedelta(days=days_period), max_date + timedelta(days=1)
+
+    def _set_searched_images(self, images: list, begin_date: datetime, end_date: datetime) -> dict:
+        """Groups the images found in the search by tile, every one of them becoming a candidate"""
+        self.available_images = {}
+        for image in images:
+            self.available_images[image.tileid] = [*self.available_images.get(image.tileid,[]), image]
+
+        self.filter_images_by_area_of_interest()
+        self.searched_images = self.available_images
+        self.searched_window = (begin_date, end_date)
+        return self.available_images
+
+    def select_available_images(self, begin_date: datetime, end_date: datetime) -> bool:
+        """Restricts the candidate images to a window of the last search, without querying again.
+        Images shared by overlapping windows are the same instances, so their metadata is only fetched once
+            Args:
+                begin_date (datetime): Window start
+                end_date (datetime): Window end (exclusive)
+            Returns:
+                bool: False if the last search doesn't cover the window, which then has to be queried
+        """
+        if not self.searched_window or begin_date < self.searched_window[0] or end_date > self.searched_window[1]:
+            return False
+        self.available_images = {}
+        for tile_name, images in self.searched_images.items():
+            window_images = [image for image in images if begin_date <= image.datetime < end_date]
+            if window_images:
+                self.available_images[tile_name] = window_images
+        return True
+
+    @property
+    def _catalog_sensor(self) -> str:
+        return self.__class__.__name__
+
+    def _query_catalog(self, area: any, begin_date: datetime, end_date: datetime) -> list:
+        """Lists the scenes of the selected tiles between begin_date and end_date, serving them from the scene catalog
+        and only querying the remote API for the date ranges the catalog hasn't covered yet for this area
+            Args:
+                area (any): Area of interest in the format expected by the remote API
+                begin_date (datetime): Search start
+                end_date (datetime): Search end
+            Returns:
+                list: SceneRecord of each scene
+        """
+        if not self.tile_names:
+            try:
+                return [scene for scenes in self._query_remote_scenes(area=area, begin_date=begin_date, end_date=end_date) for scene in scenes]
+            except ImageSearchError:
+                return []
+
+        missing_ranges = self.scene_catalog.get_missing_ranges(
+            sensor=self._catalog_sensor,
+            tiles=self.tile_names,
+            area=area,
+            begin_date=begin_date,
+            end_date=end_date,
+            max_cloud_coverage=self.max_cloud_coverage
+        )
+        for missing_begin_date, missing_end_date in missing_ranges:
+            try:
+                # Each batch is stored as it arrives, so large searches never sit in memory at once
+                for scenes in self._query_remote_scenes(area=area, begin_date=missing_begin_date, end_date=missing_end_date):
+                    self.scene_catalog.put_scenes(sensor=self._catalog_sensor, scenes=scenes)
+            except ImageSearchError:
+                continue # Failed query, the range stays uncovered
+            self.scene_catalog.add_coverage(
+                sensor=self._catalog_sensor,
+                tiles=self.tile_names,
+                area=area,
+                begin_date=missing_begin_date,
+                end_date=missing_end_date,
+                max_cloud_coverage=self.max_cloud_coverage
+            )
+
+        return self.scene_catalog.get_scenes(
+            sensor=self._catalog_sensor,
+            tiles=self.tile_names,
+            begin_date=begin_date,
+            end_date=end_date,
+            max_cloud_coverage=self.max_cloud_coverage
+        )
+
+    def _query_remote_scenes(self, area: any, begin_date: datetime, end_date: datetime) -> Iterator[list]:
+        """Queries the remote API, yielding batches of SceneRecord
+            Raises:
+                ImageSearchError: The search failed, so the range can't be considered as covered
+        """
+        return iter([])
+
+    def _build_images(self, scenes: list) -> list:
+        """Creates the image instances of catalogued scenes"""
+        pass
+
     def get_best_available_images_for_tile(
         self,
         tile_name:str,
@@ -79,39 +201,115 @@ class BaseImageAcquisitionService(BaseProperties):
         days_period: int = None,
         image_prefix: str = None
     ) -> dict:
+        best_available_images = self.select_best_images_for_tile(
+            tile_name=tile_name,
+            area_of_interest=area_of_interest,
+            max_date=max_date,
+            days_period=days_period
+        )
+        if not best_available_images:
+            return {}
+
+        downloaded_images = self.download_tile_images(
+            images=best_available_images,
+            output_name=self.get_tile_output_name(tile_name=tile_name, image_prefix=image_prefix)
+        )
+
+        # List of best images Instances (already downloaded)
+        return {'images':downloaded_images, 'tile':tile_name}
+
+    def get_tile_output_name(self, tile_name: str, image_prefix: str = None) -> str:
         if not image_prefix:
             image_prefix = f'{self.sensor[:2]}{self.sensor[-1]}'
-            
-        if not self.available_images:
-            if not area_of_interest:
-                raise ValidationError('Não existem imagens em memória, para busca-las é necessário informar uma area de interesse')
-            self.query_available_images(area_of_interest=area_of_interest, max_date=max_date, days_period=days_period)
+        return f'{image_prefix}_{tile_name}'
+
+    def select_best_images_for_tile(
+        self,
+        tile_name:str,
+        area_of_interest: Feature = None,
+        max_date: datetime = None,
+        days_period: int = None
+    ) -> list:
+        """Chooses the images that will compose the tile, without downloading them"""
+        with self._available_images_lock:
+            if not self.searched_window:
+                if not area_of_interest:
+                    raise ValidationError('Não existem imagens em memória, para busca-las é necessário informar uma area de interesse')
+                self.query_available_images(area_of_interest=area_of_interest, max_date=max_date, days_period=days_period)
 
         available_tile_images = self.available_images.get(tile_name)
         if not available_tile_images:
             NoImageFoundForTile(tile_name)
-            return {}
-            
-        best_available_images = self._get_most_recent_image(
-            images=available_tile_images,
+            return []
+
+        best_available_images = self._get_best_possile_images(
+            list_of_images=available_tile_images,
             max_date=max_date,
-            days_period=days_period)
-        
+            days_period=days_period,
+            tile_name=tile_name
+        )
+
         if not best_available_images:
             NoImageFoundForTile(tile_name)
-            return {}
+            return []
 
         if not isinstance(best_available_images, list):
             best_available_images = [best_available_images]
+        return best_available_images
 
-        [image.download_image(
-            image_database=self.images_database,
-            output_name=f'{image_prefix}_{tile_name}'
-        ) for image in best_available_images]
+    def _get_best_possile_images(self, list_of_images: list, max_date: datetime = None, days_period: datetime = None, tile_name: str = None) -> list:
+        return self._get_most_recent_image(images=list_of_images, max_date=max_date, days_period=days_period)
+
+    def fetch_image_metadata(self, image: any) -> None:
+        """Loads the image metadata needed to choose the best images of a tile, if any"""
+        pass
+
+    def store_image_metadata(self, images: list) -> None:
+        """Persists the loaded metadata of the images in the scene catalog, so it's never fetched again"""
+        pass
+
+    def prefetch_image_metadata(self, images: list) -> None:
+        """Loads the metadata of the images concurrently, only called by the selections that need it
+            Args:
+                images (list): Candidate images of a tile
+        """
+        if not images:
+            return
+
+        with ThreadPoolExecutor(max_workers=min(len(images), self.http_pool_size)) as executor:
+            list(executor.map(lambda image: self.fetch_image_metadata(image=image), images))
+        self.store_image_metadata(images=images)
+
+    def download_tile_images(self, images: list, output_name: str) -> list:
+        """Downloads and composes the selected images of a tile
+            Returns:
+                list: Images successfully composed
+        """
+        downloaded_images = []
+        for image in images:
+            if not self.download_image_bands(image=image, output_name=output_name):
+                continue
+            if self.compose_tile_image(image=image):
+                downloaded_images.append(image)
+                if self._single_image_per_tile:
+                    break
+        return downloaded_images
+
+    def download_image_bands(self, image: any, output_name: str) -> bool:
+        """Downloads the image bands, skipping the image while its server is unavailable or if it refuses the request"""
+        try:
+            image.download_bands(image_database=self.images_database, output_name=output_name)
+            return True
+        except (CircuitOpenError, RequestRejectedError):
+            return False
+
+    def compose_tile_image(self, image: any) -> bool:
+        try:
+            image.compose_bands()
+            return True
+        except PansharpCustomException:
+            return False
 
-        # List of best images Instances (already downloaded)
-        return {'images':best_available_images, 'tile':tile_name}
-    
     @staticmethod
     def _sort_images_by_date(images) -> list:
         images_dict = {i.date:i for i in images}
@@ -133,10 +331,55 @@ class BaseImageAcquisitionService(BaseProperties):
             most_recent_image = image
         return most_recent_image
 
+    def get_tile_index(self, name_field: str = 'NAME') -> TileIndex:
+        if not self.tiles_layer or not self.tiles_layer.exists:
+            raise NoBaseTilesLayerFound()
+        return TileIndex.load(
+            layer=self.tiles_layer.full_path,
+            name_field=name_field,
+            database=self.base_gbd.full_path,
+            cache_file=os.path.join(self.download_storage, 'Tile_Index', f'{self._tiles_layer_name}_{name_field}.pickle')
+        )
+
+    def get_tile_target_area(self, tile_name: str) -> any:
+        """Part of the tile inside the area of interest, in the spatial reference of the tile index"""
+        if not self.tile_index or not self.area_of_interest_geometry:
+            return None
+        if tile_name not in self._target_areas:
+            tile_polygon = self.tile_index.get_tile_polygon(tile_name)
+            target_area = tile_polygon.intersect(self.area_of_interest_geometry, 4) if tile_polygon else None
+            self._target_areas[tile_name] = target_area if target_area and target_area.area else None
+        return self._target_areas.get(tile_name)
+
+    def filter_images_by_area_of_interest(self) -> None:
+        """Drops, before anything is downloaded, the candidate images whose footprint doesn't reach
+        _min_area_of_interest_overlap percent of the tile ∩ area of interest"""
+        dropped_images = 0
+        for tile_name, images in self.available_images.items():
+            target_area = self.get_tile_target_area(tile_name=tile_name)
+            if not target_area:
+                continue
+            selector = FootprintCoverageSelector(target_area=target_area)
+            overlapping_images = []
+            for image in images:
+                footprint = selector.get_footprint(image)
+                if footprint is None:
+                    overlapping_images.append(image) # Without a footprint the image can't be discarded
+                    continue
+                image.area_of_interest_coverage = selector.coverage(footprint)
+                if image.area_of_interest_coverage >= self._min_area_of_interest_overlap:
+                    overlapping_images.append(image)
+            dropped_images += len(images) - len(overlapping_images)
+            self.available_images[tile_name] = overlapping_images
+
+        if dropped_images:
+            aprint(f'      > {dropped_images} imagens descartadas por não recobrirem a área de interesse')
+
     def get_selected_tiles_names(self, area_of_interest: Feature = None, where_clause: str = None, name_field: str = 'NAME') -> list:
-        if not self.selected_tiles:
-            self._select_tiles(area_of_interest=area_of_interest, where_clause=where_clause)
-        self.tile_names = [i[0] for i in SearchCursor(self.selected_tiles.full_path, [name_field])]
+        if not self.tile_names:
+            self.tile_index = self.get_tile_index(name_field=name_field)
+            self.area_of_interest_geometry = self.tile_index.read_geometry(feature=area_of_interest.full_path, where_clause=where_clause)
+            self.tile_names = self.tile_index.query(self.area_of_interest_geometry) if self.area_of_interest_geometry else []
         aprint(f'      > Tiles sendo processados: | {" | ".join(self.tile_names)} |')
         return self.tile_names
     
@@ -152,17 +395,42 @@ class Cbers(BaseImageAcquisitionService):
     ]
     _tiles_layer_name = 'grade_cebers_brasil'
     _days_gap: int = 60
+    _single_image_per_tile: bool = True
+    _page_size: int = 500
     credentials: dict = {}
+    _session: requests.Session = None
+    _downloader: ResumableDownloader = None
 
     @property
     def ml_model(self) -> BaseImageClassifier:
         return CbersImageClassifier()
 
+    @property
+    def service_url(self) -> str:
+        return self.credentials.get('url')
+
+    @property
+    def session(self) -> requests.Session:
+        """Keep-alive session shared by the STAC search and every band download"""
+        if not self._session:
+            self._session = create_pooled_session(pool_size=self.http_pool_size)
+        return self._session
+
+    @property
+    def downloader(self) -> ResumableDownloader:
+        if not self._downloader:
+            self._downloader = ResumableDownloader(
+                session=self.session,
+                timeout=self.http_timeout_seconds,
+                governor=self.download_governor
+            )
+        return self._downloader
+
     def get_selected_tiles_names(self, *args, **kwargs) -> list:
         return super().get_selected_tiles_names(name_field='PATH_ROW', *args, **kwargs)
         
-    @prevent_server_error
-    def _query_images(self, area: str, begin_date: datetime, end_date: datetime) -> list:
+    @prevent_server_error(policy=QUERY_RETRY_POLICY)
+    def _query_page(self, area: str, begin_date: datetime, end_date: datetime, page: int) -> dict:
         payload = json.dumps(
             {
                 "providers": [
@@ -175,139 +443,126 @@ class Cbers(BaseImageAcquisitionService):
                 ],
                 "bbox": area,
                 "datetime": f"{self.format_date_as_str(begin_date)}/{self.format_date_as_str(end_date)}",
-                "limit": 10000
+                "limit": self._page_size,
+                "page": page
             }
         )
         headers = {'Content-Type': 'application/json'}
-        response = requests.post(self.credentials.get('url'), headers=headers, data=payload)
-        scenes = []
+        response = self.session.post(self.service_url, headers=headers, data=payload, timeout=self.http_timeout_seconds)
+        if response.status_code >= 500 or response.status_code in QUERY_RETRY_POLICY.retryable_client_status_codes:
+            response.raise_for_status() # Retried with backoff, or after the Retry-After time
 
         if response.status_code != HTTPStatus.OK.value:
             aprint(f'Não foram encontradas imagens que se enquadrem nos parâmetros.\n{response}')
-            return []
-        
-        feature_collection = response.json().get('INPE-CDSR',{})
-        feature_list = []
-        for collection in feature_collection:
-            feature_list.extend(feature_collection.get(collection).get('features',[]))
-        for scene in feature_list:
-            scene['properties']['col'] = scene['properties'].pop('path')
-            scene['properties']['cloudcoverpercentage'] = scene['properties'].pop('cloud_cover')
-            scenes.append(
-                {
-                    'id': scene.get('id'),
-                    'properties': scene.get('properties'),
-                    'pan_url': f"{scene.get('assets')['pan']['href']}?email={self.credentials.get('user')}",
-                    'red_url': f"{scene.get('assets')['red']['href']}?email={self.credentials.get('user')}",
-                    'blue_url': f"{scene.get('assets')['blue']['href']}?email={self.credentials.get('user')}",
-                    'green_url': f"{scene.get('assets')['green']['href']}?email={self.credentials.get('user')}",
-                    'nir_url': f"{scene.get('assets')['nir']['href']}?email={self.credentials.get('user')}"
-                }
-            )
-        return scenes
-
-    def get_best_available_images_for_tile(
-        self,
-        tile_name: str,
-        area_of_interest: Feature = None,
-        max_date: datetime = None,
-        days_period: int = None,
-        image_prefix: str = None
-    ) -> dict:
-        if not image_prefix:
-            image_prefix = f'{self.sensor[:2]}{self.sensor[-1]}'
-            
-        if not self.available_images:
-            if not area_of_interest:
-                raise ValidationError('Não existem imagens em memória, para busca-las é necessário informar uma area de interesse')
-            self.query_available_images(area_of_interest=area_of_interest, max_date=max_date, days_period=days_period)
-
-        available_tile_images = self.available_images.get(tile_name)
-        if not available_tile_images:
-            NoImageFoundForTile(tile_name)
-            return {}
-            
-        best_available_images = self._sort_images_by_date(images=available_tile_images)
-        
-        if not best_available_images:
-            NoImageFoundForTile(tile_name)
-            return {}
-
-        if not isinstance(best_available_images, list):
-            best_available_images = [best_available_images]
-
-        downloaded_images = []
-        for image in best_available_images:
-            try:
-                image.download_image(
-                    image_database=self.images_database,
-                    output_name=f'{image_prefix}_{tile_name}'
-                )
-                downloaded_images.append(image)
-                break
-            except PansharpCustomException:
-                continue
+            return None
+        return response.json().get('INPE-CDSR',{})
+
+    def _query_images(self, area: str, begin_date: datetime, end_date: datetime) -> Iterator[list]:
+        """Searches the scenes page by page, yielding the scenes of each page as soon as it arrives.
+        Pages are requested until no collection fills a whole page"""
+        scene_ids = set()
+        page = 1
+        while True:
+            feature_collection = self._query_page(area=area, begin_date=begin_date, end_date=end_date, page=page)
+            if feature_collection is None:
+                raise ImageSearchError(sensor='CBERS')
+
+            full_page = False
+            scenes = []
+            for collection in feature_collection:
+                features = feature_collection.get(collection).get('features',[])
+                full_page = full_page or len(features) >= self._page_size
+                for scene in features:
+                    if scene.get('id') in scene_ids: continue
+                    scene_ids.add(scene.get('id'))
+                    scenes.append(self._format_scene(scene=scene))
+
+            if scenes:
+                yield scenes
+            if not full_page or not scenes:
+                return # Last page, or a server that ignores the page parameter
+            page += 1
+
+    def _format_scene(self, scene: dict) -> dict:
+        scene['properties']['col'] = scene['properties'].pop('path')
+        scene['properties']['cloudcoverpercentage'] = scene['properties'].pop('cloud_cover')
+        return {
+            'id': scene.get('id'),
+            'geometry': scene.get('geometry'),
+            'properties': scene.get('properties'),
+            'pan_url': f"{scene.get('assets')['pan']['href']}?email={self.credentials.get('user')}",
+            'red_url': f"{scene.get('assets')['red']['href']}?email={self.credentials.get('user')}",
+            'blue_url': f"{scene.get('assets')['blue']['href']}?email={self.credentials.get('user')}",
+            'green_url': f"{scene.get('assets')['green']['href']}?email={self.credentials.get('user')}",
+            'nir_url': f"{scene.get('assets')['nir']['href']}?email={self.credentials.get('user')}"
+        }
 
-        # List of best images Instances (already downloaded)
-        return {'images':downloaded_images, 'tile':tile_name}
-    
     def query_available_images(self, area_of_interest: Feature, max_date: datetime, days_period: int):
-        if not max_date: max_date = self.today
-        if not days_period: days_period = self._days_gap
-        begin_date = max_date - timedelta(days=days_period)
-        end_date = max_date + timedelta(days=1)
+        begin_date, end_date = self.get_search_window(max_date=max_date, days_period=days_period)
         area = area_of_interest.bounding_box()
         
         aprint(f'      > Buscando imagens Disponíveis > CBERS - {begin_date.date()} a {end_date.date()}')
-        identified_images = self._query_images(area=area, begin_date=begin_date, end_date=end_date)
-        self.available_images = {}
+        scenes = self._query_catalog(area=area, begin_date=begin_date, end_date=end_date)
+        return self._set_searched_images(images=self._build_images(scenes=scenes), begin_date=begin_date, end_date=end_date)
+
+    def _query_remote_scenes(self, area: str, begin_date: datetime, end_date: datetime) -> Iterator[list]:
+        for identified_images in self._query_images(area=area, begin_date=begin_date, end_date=end_date):
+            yield self._get_scenes(identified_images=identified_images)
+
+    def _get_scenes(self, identified_images: list) -> list:
+        scenes = []
         for image_feature in identified_images:
+            if not image_feature.get('id', False): continue
             image_properties = image_feature.get('properties',{})
-            image_title = image_feature.get('id', False)
-            if not image_title: continue
-
-            cbers_image = CbersImage(
-                geometry=image_feature.get('geometry',{}),
-                properties=image_properties,
-                title=image_title,
-                pan_url=image_feature.get('pan_url'),
-                red_url=image_feature.get('red_url'),
-                blue_url=image_feature.get('blue_url'),
-                green_url=image_feature.get('green_url'),
-                nir_url=image_feature.get('nir_url'),
-                **image_properties
+            tileid, image_datetime = CbersImage.split_properties(image_properties)
+            scenes.append(
+                SceneRecord(
+                    scene_id=image_feature.get('id'),
+                    tile=tileid,
+                    datetime=image_datetime,
+                    feature={'geometry': image_feature.get('geometry'), 'properties': image_properties},
+                    title=image_feature.get('id'),
+                    cloud_cover=image_properties.get('cloudcoverpercentage'),
+                    assets={band:image_feature.get(band) for band in ['pan_url', 'red_url', 'blue_url', 'green_url', 'nir_url']}
+                )
             )
-            self.available_images[cbers_image.tileid] = [*self.available_images.get(cbers_image.tileid,[]), cbers_image]
+        return scenes
 
-        return self.available_images
+    def _build_images(self, scenes: list) -> list:
+        return [CbersImage(record=scene, downloader=self.downloader) for scene in scenes]
 
     def authenticate_api(self, credentials: list) -> None:
         self.credentials = credentials.get('cbers_api',{})
         if not self.credentials:
             raise NoCbersCredentials()
     
-    def _get_best_possile_images(self, list_of_images: list, max_date: datetime = None, days_period: datetime = None) -> list:
-        return self._get_most_recent_image(images=list_of_images, max_date=max_date, days_period=days_period)
+    def _get_best_possile_images(self, list_of_images: list, max_date: datetime = None, days_period: datetime = None, tile_name: str = None) -> list:
+        # Every image is a candidate, from the most recent to the oldest, until one of them can be pansharpened.
+        # Images of the same date are tried by their coverage of the area of interest
+        return sorted(
+            list_of_images,
+            key=lambda image: (image.date, image.area_of_interest_coverage or 0),
+            reverse=True
+        )
 
 class Sentinel2(BaseImageAcquisitionService):
     _scene_min_coverage_threshold: float = 1.5
+    _target_coverage: float = 98 # Union coverage (%) of the tile ∩ area of interest that ends the scene selection
     _combined_scene_min_coverage_threshold: float = 90
     _tiles_layer_name: str = 'grade_sentinel_brasil'
-    available_images: dict = {}
     apis: list = []
 
     def authenticate_api(self, credentials: list) -> None:
         credentials = credentials.get('sentinel2_api')
         if not isinstance(credentials, list):
             credentials = [credentials]
-        for credential in credentials:
-            self.apis.append(SentinelAPI(*list(credential.values())))
+        self.apis = [SentinelAPI(*list(credential.values())) for credential in credentials]
 
     @property    
     def ml_model(self) -> BaseImageClassifier:
         return Sentinel2ImageClassifier()
     
-    @prevent_server_error
+    @prevent_server_error(policy=QUERY_RETRY_POLICY)
     def _query_images(self, api: any, area: str, begin_date: datetime, end_date: datetime) -> list:
         if not api: return []
         # payload = {
@@ -333,67 +588,128 @@ class Sentinel2(BaseImageAcquisitionService):
         return super().get_selected_tiles_names(name_field='NAME', *args, **kwargs)
 
     def query_available_images(self, area_of_interest: Feature, max_date: datetime, days_period: int) -> dict:
-        if not max_date: max_date = self.today
-        if not days_period: days_period = self._days_gap
-        begin_date = max_date - timedelta(days=days_period)
-        end_date = max_date + timedelta(days=1)
+        begin_date, end_date = self.get_search_window(max_date=max_date, days_period=days_period)
         self.min_date = begin_date
         self.max_date = end_date
         aoi_geojson = area_of_interest.geojson_geometry()
         area = geojson_to_wkt(aoi_geojson)
         
         aprint(f'   > Sentinel2 - {begin_date.date()} a {end_date.date()}')
-        # Sentinel has multiple APIs, so this loops through it and pre loads credentials
-        for api in self.apis:
-            identified_images = self._query_images(api=api, area=area, begin_date=begin_date, end_date=end_date)
-            self.available_images = {}
-            for image_feature in identified_images:
+        scenes = self._query_catalog(area=area, begin_date=begin_date, end_date=end_date)
+        return self._set_searched_images(images=self._build_images(scenes=scenes), begin_date=begin_date, end_date=end_date)
+
+    @staticmethod
+    def _get_account_name(api: SentinelAPI) -> str:
+        auth = getattr(api.session, 'auth', None)
+        return auth[0] if auth else api.api_url
+
+    def _query_remote_scenes(self, area: str, begin_date: datetime, end_date: datetime) -> Iterator[list]:
+        """Queries every account at the same time and deduplicates the scenes by product uuid,
+        keeping track of the accounts that can serve each of them. An account that fails is left
+        out of the results
+            Raises:
+                ImageSearchError: Every account failed
+        """
+        with ThreadPoolExecutor(max_workers=max(len(self.apis), 1)) as executor:
+            queries = [
+                (api, executor.submit(self._query_images, api=api, area=area, begin_date=begin_date, end_date=end_date))
+                for api in self.apis
+            ]
+            identified_images = []
+            failures = []
+            for api, query in queries:
+                try:
+                    identified_images.append((api, query.result()))
+                except (Exception, SystemExit) as e: # MaxFailuresError exits once the retries run out
+                    aprint(f'Falha na busca de imagens Sentinel2 pela conta {self._get_account_name(api)}.\n{e}', level=LogLevels.WARNING)
+                    failures.append(e)
+
+        if failures and not identified_images:
+            raise ImageSearchError(sensor='Sentinel2', error=failures[-1])
+
+        scenes = OrderedDict()
+        for api, image_features in identified_images:
+            for image_feature in image_features:
                 image_properties = image_feature.get('properties',{})
                 image_title = image_properties.get('title', False)
                 if not image_title: continue
 
-                sentinel_image = SentinelImage(
-                    api=api,
-                    geometry=image_feature.get('geometry',{}),
-                    properties=image_properties,
-                    **image_properties
+                scene_id = image_properties.get('uuid', image_title)
+                if scene_id in scenes:
+                    scenes[scene_id].sources.append(self._get_account_name(api))
+                    continue
+
+                tileid, image_datetime = SentinelImage.split_title(image_title)
+                scenes[scene_id] = SceneRecord(
+                    scene_id=scene_id,
+                    tile=tileid,
+                    datetime=image_datetime,
+                    feature={'geometry': image_feature.get('geometry'), 'properties': image_properties},
+                    title=image_title,
+                    filename=image_properties.get('filename'),
+                    cloud_cover=image_properties.get('cloudcoverpercentage'),
+                    assets={'product': image_properties.get('link')},
+                    sources=[self._get_account_name(api)]
                 )
-                self.available_images[sentinel_image.tileid] = [*self.available_images.get(sentinel_image.tileid,[]), sentinel_image]
-
-        return self.available_images
-
-    def get_best_available_images_for_tile(self, tile_name:str, area_of_interest: Feature = None, max_date: datetime = None, days_period: int = None, image_prefix: str = None) -> dict:
-        if not image_prefix:
-            image_prefix = f'{self.sensor[:2]}{self.sensor[-1]}'
-            
-        if not self.available_images:
-            if not area_of_interest:
-                raise ValidationError('Não existem imagens em memória, para busca-las é necessário informar uma area de interesse')
-            self.query_available_images(area_of_interest=area_of_interest, max_date=max_date, days_period=days_period)
-
-        available_tile_images = self.available_images.get(tile_name)
-        if not available_tile_images:
-            NoImageFoundForTile(tile_name)
-            return {}
-            
-        best_available_images = self._get_best_possile_images_based_on_coverage(
-            images=available_tile_images
+        yield list(scenes.values())
+
+    def _build_images(self, scenes: list) -> list:
+        """Creates one SentinelImage per scene, spreading the downloads across the accounts that can serve them"""
+        accounts = {self._get_account_name(api):api for api in self.apis}
+        assigned_scenes = {account:0 for account in accounts}
+        apis_by_sources = {} # Scenes found by the same accounts share one list of apis
+        sentinel_images = []
+        for scene in scenes:
+            # Scenes catalogued by accounts that are no longer configured may be served by any of the current ones
+            sources = tuple(source for source in scene.sources if source in accounts) or tuple(accounts)
+            # Each scene is downloaded by the account, among those that found it, with the fewest scenes so far
+            account = min(sources, key=lambda source: assigned_scenes.get(source))
+            assigned_scenes[account] += 1
+            if sources not in apis_by_sources:
+                apis_by_sources[sources] = [accounts.get(source) for source in sources]
+            sentinel_images.append(SentinelImage(api=accounts.get(account), apis=apis_by_sources[sources], record=scene))
+        return sentinel_images
+
+    def _get_best_possile_images(self, list_of_images: list, max_date: datetime = None, days_period: datetime = None, tile_name: str = None) -> list:
+        target_area = self.get_tile_target_area(tile_name=tile_name)
+        if target_area:
+            selector = FootprintCoverageSelector(
+                target_area=target_area,
+                target_coverage=self._target_coverage,
+                min_contribution=self._scene_min_coverage_threshold
+            )
+            best_available_images = selector.select(images=list_of_images)
+            if best_available_images is not None:
+                return best_available_images
+        # Without footprints (or a known area of interest), the coverage is estimated from the nodata percentages,
+        # so the QI metadata is only fetched for the tiles that get here
+        self.prefetch_image_metadata(images=list_of_images)
+        return self._get_best_possile_images_based_on_coverage(images=list_of_images)
+
+    def fetch_image_metadata(self, image: SentinelImage) -> None:
+        image.nodata_pixel_percentage # Only fetched if the catalog doesn't have it yet
+
+    def store_image_metadata(self, images: list) -> None:
+        self.scene_catalog.set_nodata_pixel_percentages(
+            sensor=self._catalog_sensor,
+            nodata_pixel_percentages={
+                image.uuid:image.nodata_pixel_percentage
+                for image in images if image.nodata_pixel_percentage_str
+            }
         )
-        
-        if not best_available_images:
-            NoImageFoundForTile(tile_name)
-            return {}
 
-        if not isinstance(best_available_images, list):
-            best_available_images = [best_available_images]
-
-        [image.download_image(
-            image_database=self.images_database,
-            output_name=f'{image_prefix}_{tile_name}'
-        ) for image in best_available_images]
-
-        # List of best images Instances (already downloaded)
-        return {'images':best_available_images, 'tile':tile_name}
+    def download_tile_images(self, images: list, output_name: str) -> list:
+        """Downloads the bands of the next scene while the previous one is being composed"""
+        downloaded_images = []
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            next_download = executor.submit(self.download_image_bands, image=images[0], output_name=output_name)
+            for index, image in enumerate(images):
+                downloaded = next_download.result()
+                if index + 1 < len(images):
+                    next_download = executor.submit(self.download_image_bands, image=images[index + 1], output_name=output_name)
+                if downloaded and self.compose_tile_image(image=image):
+                    downloaded_images.append(image)
+        return downloaded_images
     
     def _get_best_possile_images_based_on_coverage(self, images: list, min_coverage: int = 98, combined_coverage: int = 170) -> list:
         response = []
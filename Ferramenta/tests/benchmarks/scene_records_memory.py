@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+"""Memory used by a large Sentinel-2 search served from the scene catalog.
+
+Catalogs `count` synthetic scenes (50k by default, with the properties the Copernicus API returns),
+then measures with tracemalloc the SceneRecord list returned by the catalog and the SentinelImage
+list built from it. The same scenes, decoded into dicts as the API returns them, are measured as
+the reference of the previous representation.
+
+    python tests/benchmarks/scene_records_memory.py [count]
+"""
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from core.instances.Images import SentinelImage
+from core.libs.SceneCatalog import SceneCatalog, SceneRecord
+from core.services.SateliteImagery.ImageryServices import Sentinel2
+
+
+def create_feature(index: int) -> dict:
+    tile = f'{random.randint(18, 25)}{random.choice("KLMN")}{random.choice("ABCDEFGH")}{random.choice("ABCDEFGH")}'
+    acquisition_date = datetime(2026, 1, 1) + timedelta(minutes=13*index)
+    title = f'S2B_MSIL2A_{acquisition_date:%Y%m%dT%H%M%S}_N0509_R{index%143:03d}_T{tile}_{acquisition_date:%Y%m%dT%H%M%S}'
+    properties = {
+        'title': title,
+        'identifier': title,
+        'filename': f'{title}.SAFE',
+        'uuid': f'{index:08d}-aaaa-bbbb-cccc-dddddddddddd',
+        'link': f"https://apihub/odata/v1/Products('{index:08d}')/$value",
+        'link_alternative': 'x'*80,
+        'link_icon': 'y'*90,
+        'summary': 'Date: ..., Instrument: MSI, Satellite: Sentinel-2, Size: 1.08 GB',
+        'ondemand': 'false',
+        'generationdate': str(acquisition_date),
+        'beginposition': str(acquisition_date),
+        'endposition': str(acquisition_date),
+        'ingestiondate': str(acquisition_date),
+        'orbitnumber': 30000 + index,
+        'relativeorbitnumber': index%143,
+        'vegetationpercentage': random.random()*100,
+        'notvegetatedpercentage': random.random()*100,
+        'waterpercentage': random.random()*100,
+        'unclassifiedpercentage': random.random(),
+        'mediumprobacloudspercentage': random.random()*10,
+        'highprobacloudspercentage': random.random()*10,
+        'snowicepercentage': 0.0,
+        'cloudcoverpercentage': random.random()*30,
+        'level1cpdiidentifier': 'S2B_OPER_MSI_L1C_TL_' + 'z'*40,
+        'gmlfootprint': '<gml:Polygon>' + '1.0,2.0 '*25 + '</gml:Polygon>',
+        'footprint': 'MULTIPOLYGON ((' + '-47.1 -15.2, '*25 + '))',
+        'format': 'SAFE',
+        'processingbaseline': '05.09',
+        'platformname': 'Sentinel-2',
+        'instrumentname': 'Multi-Spectral Instrument',
+        'instrumentshortname': 'MSI',
+        'size': '1.08 GB',
+        's2datatakeid': 'GS2B_' + '1'*30,
+        'producttype': 'S2MSI2A',
+        'platformidentifier': '2017-013A',
+        'orbitdirection': 'DESCENDING',
+        'platformserialidentifier': 'Sentinel-2B',
+        'processinglevel': 'Level-2A',
+        'datastripidentifier': 'S2B_OPER_MSI_L2A_DS_' + 'w'*40,
+        'granuleidentifier': 'S2B_OPER_MSI_L2A_TL_' + 'v'*40
+    }
+    geometry = {'type': 'MultiPolygon', 'coordinates': [[[[-47.0 + random.random(), -15.0 + random.random()] for _ in range(12)]]]}
+    return {'geometry': geometry, 'properties': properties}
+
+
+def get_traced_mib() -> float:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]/2**20
+
+
+def main(count: int = 50000) -> None:
+    random.seed(1)
+    catalog = SceneCatalog(path=os.path.join(tempfile.mkdtemp(), 'Scene_Catalog.sqlite'))
+    features = [create_feature(index) for index in range(count)]
+    scenes = []
+    for feature in features:
+        properties = feature.get('properties')
+        tile, acquisition_date = SentinelImage.split_title(properties.get('title'))
+        scenes.append(SceneRecord(
+            scene_id=properties.get('uuid'),
+            tile=tile,
+            datetime=acquisition_date,
+            feature=feature,
+            title=properties.get('title'),
+            filename=properties.get('filename'),
+            cloud_cover=properties.get('cloudcoverpercentage'),
+            assets={'product': properties.get('link')},
+            sources=['user']
+        ))
+    catalog.put_scenes(sensor='Sentinel2', scenes=scenes)
+    tiles = sorted({scene.tile for scene in scenes})
+    serialized_features = [json.dumps(feature) for feature in features]
+    del scenes, features
+
+    service = Sentinel2.__new__(Sentinel2)
+    api = MagicMock() # Only its account name and url are read while the images are built
+    api.session.auth = ('user', 'password')
+    api.api_url = 'https://apihub/'
+    service.apis = [api]
+
+    tracemalloc.start()
+    decoded_features = [json.loads(feature) for feature in serialized_features]
+    decoded_mib = get_traced_mib()
+    del decoded_features
+
+    initial_mib = get_traced_mib()
+    records = catalog.get_scenes(sensor='Sentinel2', tiles=tiles, begin_date=datetime(2025, 1, 1), end_date=datetime(2028, 1, 1))
+    records_mib = get_traced_mib() - initial_mib
+    images = service._build_images(scenes=records)
+    records_and_images_mib = get_traced_mib() - initial_mib
+    del records
+    images_mib = get_traced_mib() - initial_mib
+    tracemalloc.stop()
+
+    print(f'{len(images)} cenas')
+    print(f'Features decodificadas (referência): {decoded_mib:.1f} MiB')
+    print(f'SceneRecord: {records_mib:.1f} MiB')
+    print(f'SceneRecord + SentinelImage: {records_and_images_mib:.1f} MiB')
+    print(f'SentinelImage: {images_mib:.1f} MiB')
+
+
+if __name__ == '__main__':
+    main(count=int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+import os
+import sys
+
+# The tool is run from the Ferramenta folder, so `core` is imported as a top level package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+import gc
+import os
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('arcpy') # The services compose the images with arcpy
+
+from core.libs.Downloader import ResumableDownloader
+from core.services.SateliteImagery.AcquisitionEngine import \
+    AsyncAcquisitionEngine
+
+BAND_CONTENT = b'band'*1024
+
+
+class FakeImage:
+    def __init__(self, name: str, composition_seconds: float = 0, composition_error: bool = False, download_error: bool = False) -> None:
+        self.name = name
+        self.composition_seconds = composition_seconds
+        self.composition_error = composition_error
+        self.download_error = download_error
+
+
+class BandRequestHandler(BaseHTTPRequestHandler):
+    """Serves BAND_CONTENT for any band path, recording the requested paths"""
+    requested_paths = []
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self.requested_paths.append(self.path)
+        self.send_response(HTTPStatus.OK.value)
+        self.send_header('Content-Length', str(len(BAND_CONTENT)))
+        self.end_headers()
+        self.wfile.write(BAND_CONTENT)
+
+
+@pytest.fixture
+def server_url():
+    BandRequestHandler.requested_paths = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BandRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+class FakeService:
+    """Stands in for an acquisition service, recording the downloads and compositions it is asked for"""
+    _single_image_per_tile = False
+
+    def __init__(self, available_images: dict, download_seconds: float = 0, failing_tiles: list = None, server_url: str = None, download_folder: str = None) -> None:
+        self.available_images = available_images
+        self.download_seconds = download_seconds
+        self.failing_tiles = failing_tiles if failing_tiles else []
+        self.server_url = server_url
+        self.download_folder = download_folder
+        self.downloaded = []
+        self.composed = []
+        self._lock = threading.Lock()
+
+    def select_best_images_for_tile(self, tile_name: str, area_of_interest: any = None) -> list:
+        if tile_name in self.failing_tiles:
+            raise RuntimeError(f'Falha na seleção do tile {tile_name}')
+        return self.available_images.get(tile_name)
+
+    def get_tile_output_name(self, tile_name: str) -> str:
+        return tile_name
+
+    def download_image_bands(self, image: FakeImage, output_name: str) -> bool:
+        time.sleep(self.download_seconds)
+        if image.download_error:
+            raise RuntimeError(f'Falha no download de {image.name}')
+        if self.server_url:
+            ResumableDownloader(timeout=5).download(
+                url=f'{self.server_url}/{output_name}/{image.name}.tif',
+                filepath=os.path.join(self.download_folder, f'{image.name}.tif')
+            )
+        with self._lock:
+            self.downloaded.append(image.name)
+        return True
+
+    def compose_tile_image(self, image: FakeImage) -> bool:
+        time.sleep(image.composition_seconds)
+        if image.composition_error:
+            raise RuntimeError(f'Falha na composição de {image.name}')
+        with self._lock:
+            self.composed.append(image.name)
+        return True
+
+
+def test_images_are_returned_in_candidate_order():
+    service = FakeService(available_images={
+        'A': [FakeImage('a1', composition_seconds=0.2), FakeImage('a2'), FakeImage('a3')],
+        'B': [FakeImage('b1'), FakeImage('b2', composition_seconds=0.1)]
+    })
+    completed_tiles = []
+
+    results = AsyncAcquisitionEngine(service=service, max_workers=4).acquire(
+        tile_names=['A', 'B'],
+        on_tile_completed=lambda result: completed_tiles.append(result.get('tile'))
+    )
+
+    images_by_tile = {result.get('tile'):[image.name for image in result.get('images')] for result in results}
+    assert images_by_tile == {'A': ['a1', 'a2', 'a3'], 'B': ['b1', 'b2']}
+    assert sorted(completed_tiles) == ['A', 'B']
+
+
+def test_failed_tile_cancels_the_pending_work():
+    service = FakeService(
+        available_images={'B': [FakeImage(f'b{index}') for index in range(5)]},
+        download_seconds=0.2,
+        failing_tiles=['A']
+    )
+
+    with pytest.raises(RuntimeError):
+        AsyncAcquisitionEngine(service=service, max_workers=2).acquire(tile_names=['A', 'B'])
+
+    time.sleep(0.5) # Anything that wasn't cancelled would run meanwhile
+    assert len(service.downloaded) <= 1 # Only a download already running when A failed may finish
+    assert service.composed == []
+
+
+def test_images_are_downloaded_from_the_server(server_url, tmp_path):
+    service = FakeService(
+        available_images={'A': [FakeImage('a1'), FakeImage('a2')], 'B': [FakeImage('b1')]},
+        server_url=server_url,
+        download_folder=str(tmp_path)
+    )
+
+    results = AsyncAcquisitionEngine(service=service, max_workers=3).acquire(tile_names=['A', 'B'])
+
+    assert sorted(BandRequestHandler.requested_paths) == ['/A/a1.tif', '/A/a2.tif', '/B/b1.tif']
+    assert sorted(os.listdir(tmp_path)) == ['a1.tif', 'a2.tif', 'b1.tif']
+    for file in os.listdir(tmp_path):
+        with open(tmp_path/file, 'rb') as downloaded_file:
+            assert downloaded_file.read() == BAND_CONTENT
+    assert sorted(image.name for result in results for image in result.get('images')) == ['a1', 'a2', 'b1']
+
+
+def test_failed_download_retrieves_the_pending_compositions(caplog):
+    service = FakeService(
+        available_images={'A': [
+            FakeImage('a1', composition_error=True), # Fails while the next images are downloaded
+            FakeImage('a2'),
+            FakeImage('a3', download_error=True)
+        ]},
+        download_seconds=0.1
+    )
+
+    with pytest.raises(RuntimeError, match='download de a3'):
+        AsyncAcquisitionEngine(service=service, max_workers=2).acquire(tile_names=['A'])
+
+    gc.collect() # Unretrieved task exceptions are only reported when the task is collected
+    assert 'never retrieved' not in caplog.text
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+import numpy as np
+import pytest
+
+from core.libs.BlockStretch import BandStatistics, map_blocks, stretch_block
+
+NODATA = 0
+BLOCK_SIZE = 256
+
+
+@pytest.fixture
+def image() -> np.ndarray:
+    """(bands, rows, columns) image whose size isn't a multiple of the block size, with a nodata corner"""
+    image = np.random.default_rng(0).integers(1, 4000, size=(4, 1000, 777)).astype(np.uint16)
+    image[:, :100, :50] = NODATA
+    image[2, 500:, :] = NODATA # A band with more nodata than the others
+    return image
+
+
+def split_blocks(image: np.ndarray, block_size: int = BLOCK_SIZE) -> list:
+    return [
+        image[:, row:row + block_size, column:column + block_size]
+        for row in range(0, image.shape[1], block_size)
+        for column in range(0, image.shape[2], block_size)
+    ]
+
+
+def merge_blocks(blocks: list, image_shape: tuple, block_size: int = BLOCK_SIZE) -> np.ndarray:
+    columns = len(range(0, image_shape[2], block_size))
+    rows = [np.concatenate(blocks[index:index + columns], axis=2) for index in range(0, len(blocks), columns)]
+    return np.concatenate(rows, axis=1)
+
+
+def get_block_statistics(blocks: list) -> BandStatistics:
+    statistics = BandStatistics(band_count=blocks[0].shape[0])
+    for block_statistics in map_blocks(lambda block: BandStatistics.from_block(block, nodata=NODATA), iter(blocks), max_workers=3):
+        statistics.merge(block_statistics)
+    return statistics
+
+
+def test_merged_block_statistics_match_the_whole_array(image):
+    statistics = get_block_statistics(split_blocks(image))
+
+    for band in range(image.shape[0]):
+        valid_pixels = image[band][image[band] != NODATA].astype(np.float64)
+        assert statistics.count[band] == valid_pixels.size
+        assert statistics.mean[band] == pytest.approx(valid_pixels.mean(), abs=1e-6)
+        assert statistics.std[band] == pytest.approx(valid_pixels.std(), abs=1e-6)
+
+
+def test_block_stretch_matches_the_whole_array_stretch(image):
+    blocks = split_blocks(image)
+    statistics = get_block_statistics(blocks)
+    stretched = merge_blocks(
+        list(map_blocks(lambda block: stretch_block(block, statistics.mean, statistics.std, num_stddev=2, nodata=NODATA), iter(blocks), max_workers=3)),
+        image_shape=image.shape
+    )
+
+    valid_pixels = image != NODATA
+    expected = np.zeros(image.shape, dtype=np.uint8)
+    for band in range(image.shape[0]):
+        values = image[band][valid_pixels[band]].astype(np.float64)
+        low, high = values.mean() - 2*values.std(), values.mean() + 2*values.std()
+        expected[band][valid_pixels[band]] = np.clip(np.rint((values - low)*254/(high - low)) + 1, 1, 255)
+
+    assert stretched.dtype == np.uint8
+    assert stretched.shape == image.shape
+    np.testing.assert_array_equal(stretched, expected)
+    assert (stretched[~valid_pixels] == 0).all()
+    assert (stretched[valid_pixels] >= 1).all()
+
+
+def test_nan_pixels_are_treated_as_nodata():
+    block = np.array([[[1.0, np.nan], [3.0, 5.0]]])
+
+    statistics = BandStatistics.from_block(block)
+    stretched = stretch_block(block, statistics.mean, statistics.std)
+
+    assert statistics.count[0] == 3
+    assert statistics.mean[0] == pytest.approx(3.0)
+    assert stretched[0, 0, 1] == 0
+
+
+def test_blocks_without_valid_pixels_dont_change_the_statistics():
+    statistics = BandStatistics.from_block(np.array([[[2, 4], [4, 6]]], dtype=np.uint16), nodata=NODATA)
+    statistics.merge(BandStatistics.from_block(np.zeros((1, 3, 3), dtype=np.uint16), nodata=NODATA))
+
+    assert statistics.count[0] == 4
+    assert statistics.mean[0] == pytest.approx(4.0)
+    assert statistics.std[0] == pytest.approx(np.std([2, 4, 4, 6]))
+
+
+def test_constant_band_is_stretched_without_dividing_by_zero():
+    block = np.full((1, 10, 10), 7, dtype=np.uint16)
+    statistics = BandStatistics.from_block(block)
+
+    stretched = stretch_block(block, statistics.mean, statistics.std)
+
+    assert (stretched == 1).all()
+
+
+def test_map_blocks_keeps_the_block_order():
+    assert list(map_blocks(lambda value: value*2, iter(range(50)), max_workers=4)) == [value*2 for value in range(50)]
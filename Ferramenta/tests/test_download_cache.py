@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+import os
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('arcpy') # core._logs reports through arcpy
+
+from core.libs.DownloadCache import (CacheLock, SceneCache,
+                                     remove_stale_staging_folders)
+
+HOUR = 60*60
+
+
+def create_file(path: str, size: int) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(b'0'*size)
+    return path
+
+
+def get_cache(path: str, max_size_bytes: int) -> SceneCache:
+    cache = SceneCache(path=str(path), max_size_gb=1)
+    cache.max_size_bytes = max_size_bytes
+    return cache
+
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path):
+    cache = get_cache(tmp_path/'cache', max_size_bytes=2500)
+    now = time.time()
+    for index, scene_id in enumerate(['old', 'older', 'oldest']):
+        cached_file = cache.put(scene_id=scene_id, band='B02', file=create_file(str(tmp_path/'staging'/f'{scene_id}.jp2'), size=1000))
+        os.utime(cached_file, (now - (index + 2)*HOUR, now - (index + 2)*HOUR))
+
+    cache.put(scene_id='new', band='B02', file=create_file(str(tmp_path/'staging'/'new.jp2'), size=1000))
+
+    assert cache.get(scene_id='oldest', band='B02') is None
+    assert cache.get(scene_id='older', band='B02') is None
+    assert cache.get(scene_id='old', band='B02')
+    assert cache.get(scene_id='new', band='B02')
+    assert not os.path.exists(tmp_path/'cache'/'oldest') # Empty scene folders are removed as well
+
+
+def test_recently_used_entries_are_kept_over_the_budget(tmp_path):
+    cache = get_cache(tmp_path/'cache', max_size_bytes=2500)
+    now = time.time()
+    old_file = cache.put(scene_id='old', band='B02', file=create_file(str(tmp_path/'staging'/'old.jp2'), size=1000))
+    os.utime(old_file, (now - 2*HOUR, now - 2*HOUR))
+    recent_file = cache.put(scene_id='recent', band='B02', file=create_file(str(tmp_path/'staging'/'recent.jp2'), size=1000))
+    os.utime(recent_file, (now - 3*HOUR, now - 3*HOUR))
+
+    assert cache.get(scene_id='old', band='B02') # Read again, so the least recently used is the other one
+    cache.max_size_bytes = 1500
+    cache.put(scene_id='new', band='B02', file=create_file(str(tmp_path/'staging'/'new.jp2'), size=1000))
+
+    assert cache.get(scene_id='recent', band='B02') is None
+    assert cache.get(scene_id='old', band='B02')
+    assert cache.get(scene_id='new', band='B02') # Over the budget, but may still be read by a concurrent run
+
+
+def test_runs_sharing_the_store_keep_the_first_cached_band(tmp_path):
+    first_run = get_cache(tmp_path/'cache', max_size_bytes=10000)
+    second_run = get_cache(tmp_path/'cache', max_size_bytes=10000)
+    first_file = create_file(str(tmp_path/'staging'/'1'/'B02.jp2'), size=10)
+    second_file = create_file(str(tmp_path/'staging'/'2'/'B02.jp2'), size=20)
+
+    cached_file = first_run.put(scene_id='scene', band='B02', file=first_file)
+
+    assert second_run.get(scene_id='scene', band='B02') == cached_file
+    assert second_run.put(scene_id='scene', band='B02', file=second_file) == cached_file
+    assert os.path.getsize(cached_file) == 10
+    assert not os.path.exists(first_file)
+    assert not os.path.exists(second_file)
+
+
+def test_cache_lock_waits_for_the_other_run(tmp_path):
+    lock_path = str(tmp_path/'.cache.lock')
+    events = []
+
+    def hold_lock() -> None:
+        with CacheLock(lock_path):
+            events.append('first acquired')
+            time.sleep(0.3)
+            events.append('first released')
+
+    thread = threading.Thread(target=hold_lock)
+    thread.start()
+    while not events:
+        time.sleep(0.01)
+    lock = CacheLock(lock_path)
+    lock.wait_time_seconds = 0.05
+    with lock:
+        events.append('second acquired')
+    thread.join()
+
+    assert events == ['first acquired', 'first released', 'second acquired']
+    assert not os.path.exists(lock_path)
+
+
+def test_stale_cache_lock_is_taken_over(tmp_path):
+    lock_path = str(tmp_path/'.cache.lock')
+    create_file(lock_path, size=0)
+    os.utime(lock_path, (time.time() - HOUR, time.time() - HOUR)) # Left behind by a crashed run
+
+    with CacheLock(lock_path):
+        assert os.path.exists(lock_path)
+    assert not os.path.exists(lock_path)
+
+
+def test_only_staging_folders_of_finished_runs_are_removed(tmp_path):
+    finished_pid = 2**22 + 1 # Above the Linux pid_max, no process can have it
+    create_file(str(tmp_path/str(finished_pid)/'scene'/'B02.jp2.part'), size=10)
+    create_file(str(tmp_path/str(os.getpid())/'scene'/'B02.jp2.part'), size=10)
+    os.makedirs(tmp_path/'other')
+
+    remove_stale_staging_folders(path=str(tmp_path))
+
+    assert sorted(os.listdir(tmp_path)) == sorted([str(os.getpid()), 'other'])
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+import hashlib
+import os
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('arcpy') # core._logs reports through arcpy
+
+from core.libs.CustomExceptions import (ChecksumMismatchError,
+                                        IncompleteDownloadError)
+from core.libs.Downloader import ResumableDownloader
+
+CONTENT = bytes(range(256))*1024
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serves CONTENT honouring `Range: bytes=<start>-`, like the imagery servers do"""
+    requested_ranges = []
+    send_content_length = True
+    send_content_range = True
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        requested_range = self.headers.get('Range')
+        self.requested_ranges.append(requested_range)
+        start = int(requested_range.split('=')[1].rstrip('-')) if requested_range else 0
+
+        if start >= len(CONTENT):
+            self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE.value)
+            if self.send_content_range:
+                self.send_header('Content-Range', f'bytes */{len(CONTENT)}')
+            self.end_headers()
+            return
+
+        if requested_range:
+            self.send_response(HTTPStatus.PARTIAL_CONTENT.value)
+            self.send_header('Content-Range', f'bytes {start}-{len(CONTENT) - 1}/{len(CONTENT)}')
+        else:
+            self.send_response(HTTPStatus.OK.value)
+        body = CONTENT[start:]
+        if self.send_content_length:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def url():
+    RangeRequestHandler.requested_ranges = []
+    RangeRequestHandler.send_content_length = True
+    RangeRequestHandler.send_content_range = True
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}/band.tif'
+    server.shutdown()
+    server.server_close()
+
+
+def test_resumes_from_part_file(url, tmp_path):
+    filepath = str(tmp_path/'band.tif')
+    with open(f'{filepath}.part', 'wb') as part_file:
+        part_file.write(CONTENT[:100000])
+
+    ResumableDownloader(timeout=5).download(url=url, filepath=filepath, checksum=hashlib.md5(CONTENT).hexdigest())
+
+    assert RangeRequestHandler.requested_ranges == ['bytes=100000-']
+    with open(filepath, 'rb') as downloaded_file:
+        assert downloaded_file.read() == CONTENT
+    assert not os.path.exists(f'{filepath}.part')
+
+
+def test_complete_part_file_is_moved_into_place_on_416(url, tmp_path):
+    filepath = str(tmp_path/'band.tif')
+    with open(f'{filepath}.part', 'wb') as part_file:
+        part_file.write(CONTENT)
+
+    ResumableDownloader(timeout=5).download(url=url, filepath=filepath, checksum=hashlib.md5(CONTENT).hexdigest())
+
+    assert RangeRequestHandler.requested_ranges == [f'bytes={len(CONTENT)}-']
+    with open(filepath, 'rb') as downloaded_file:
+        assert downloaded_file.read() == CONTENT
+
+
+def test_part_file_is_downloaded_again_on_416_without_size(url, tmp_path):
+    RangeRequestHandler.send_content_range = False
+    filepath = str(tmp_path/'band.tif')
+    with open(f'{filepath}.part', 'wb') as part_file:
+        part_file.write(CONTENT + b'corrupted')
+
+    ResumableDownloader(timeout=5).download(url=url, filepath=filepath)
+
+    assert RangeRequestHandler.requested_ranges == [f'bytes={len(CONTENT) + 9}-', None]
+    with open(filepath, 'rb') as downloaded_file:
+        assert downloaded_file.read() == CONTENT
+
+
+def test_checksum_mismatch_discards_the_download(url, tmp_path):
+    filepath = str(tmp_path/'band.jp2')
+
+    with pytest.raises(ChecksumMismatchError):
+        ResumableDownloader(timeout=5).download(url=url, filepath=filepath, checksum=hashlib.md5(b'other').hexdigest())
+
+    assert not os.path.exists(filepath)
+    assert not os.path.exists(f'{filepath}.part') # The next attempt starts over instead of resuming corrupted bytes
+
+
+def test_checksum_is_verified_without_content_length(url, tmp_path):
+    RangeRequestHandler.send_content_length = False
+    filepath = str(tmp_path/'band.jp2')
+
+    with pytest.raises(ChecksumMismatchError):
+        ResumableDownloader(timeout=5).download(url=url, filepath=filepath, checksum=hashlib.md5(b'other').hexdigest())
+
+    assert not os.path.exists(filepath)
+
+
+def test_expected_size_keeps_a_short_download_resumable(url, tmp_path):
+    RangeRequestHandler.send_content_length = False
+    filepath = str(tmp_path/'band.jp2')
+
+    with pytest.raises(IncompleteDownloadError):
+        ResumableDownloader(timeout=5).download(url=url, filepath=filepath, checksum=hashlib.md5(CONTENT).hexdigest(), expected_size=len(CONTENT) + 10)
+
+    assert not os.path.exists(filepath)
+    assert os.path.getsize(f'{filepath}.part') == len(CONTENT)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+pytest.importorskip('arcpy') # core._logs reports through arcpy
+
+import requests
+from core.libs import RetryPolicy as retry_policy_module
+from core.libs.CustomExceptions import CircuitOpenError
+from core.libs.RetryPolicy import BackoffRetryPolicy, CircuitBreaker
+from requests.exceptions import ChunkedEncodingError, ConnectionError
+
+HOST = 'apihub.example.com'
+
+
+def create_http_error(status_code: int, headers: dict = None) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers if headers else {})
+    return requests.HTTPError(response=response)
+
+
+class Clock:
+    """Replaces time.monotonic, so the circuit timeouts pass without waiting"""
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(retry_policy_module.time, 'monotonic', clock.monotonic)
+    return clock
+
+
+def test_backoff_grows_exponentially_up_to_the_maximum(monkeypatch):
+    monkeypatch.setattr(retry_policy_module.random, 'uniform', lambda low, high: high) # Full jitter, at its upper bound
+    policy = BackoffRetryPolicy()
+    error = ConnectionError()
+
+    assert [policy.get_wait_time(failed_attempts=attempt, error=error) for attempt in range(1, 5)] == [2, 4, 8, 16]
+    assert policy.get_wait_time(failed_attempts=20, error=error) == policy.max_wait_time_seconds
+
+
+def test_backoff_is_jittered_between_zero_and_the_backoff():
+    policy = BackoffRetryPolicy()
+
+    wait_times = [policy.get_wait_time(failed_attempts=3, error=ConnectionError()) for _ in range(200)]
+
+    assert all(0 <= wait_time <= 8 for wait_time in wait_times)
+    assert len(set(wait_times)) > 1
+
+
+def test_retry_after_seconds_is_honoured():
+    policy = BackoffRetryPolicy()
+
+    assert policy.get_wait_time(failed_attempts=1, error=create_http_error(429, {'Retry-After': '30'})) == 30
+    assert policy.get_wait_time(failed_attempts=1, error=create_http_error(503, {'Retry-After': str(10**9)})) == policy.max_wait_time_seconds
+
+
+def test_retry_after_http_date_is_honoured():
+    policy = BackoffRetryPolicy()
+    retry_date = datetime.now(timezone.utc) + timedelta(seconds=120)
+
+    wait_time = policy.get_wait_time(failed_attempts=1, error=create_http_error(503, {'Retry-After': format_datetime(retry_date, usegmt=True)}))
+
+    assert 100 < wait_time <= 120
+    past_date = format_datetime(datetime.now(timezone.utc) - timedelta(seconds=60), usegmt=True)
+    assert policy.get_wait_time(failed_attempts=1, error=create_http_error(429, {'Retry-After': past_date})) == 0
+
+
+def test_retry_after_is_ignored_when_invalid_or_on_other_statuses(monkeypatch):
+    monkeypatch.setattr(retry_policy_module.random, 'uniform', lambda low, high: high)
+    policy = BackoffRetryPolicy()
+
+    assert policy.get_wait_time(failed_attempts=1, error=create_http_error(429, {'Retry-After': 'soon'})) == 2
+    assert policy.get_wait_time(failed_attempts=1, error=create_http_error(500, {'Retry-After': '30'})) == 2
+
+
+def test_only_timeouts_and_rate_limits_are_retried_among_client_errors():
+    policy = BackoffRetryPolicy()
+
+    assert policy.is_retryable(create_http_error(408))
+    assert policy.is_retryable(create_http_error(429))
+    assert not policy.is_retryable(create_http_error(403))
+    assert not policy.is_retryable(create_http_error(404))
+    assert policy.is_retryable(create_http_error(500))
+    assert policy.is_retryable(ChunkedEncodingError())
+
+
+def test_server_errors_include_dropped_connections():
+    policy = BackoffRetryPolicy()
+
+    assert policy.is_server_error(create_http_error(502))
+    assert policy.is_server_error(create_http_error(429))
+    assert policy.is_server_error(ChunkedEncodingError())
+    assert policy.is_server_error(ConnectionError())
+    assert not policy.is_server_error(create_http_error(404))
+    assert not policy.is_server_error(ValueError())
+
+
+def test_circuit_opens_after_the_failure_threshold(clock):
+    circuit_breaker = CircuitBreaker(failure_threshold=3, reset_timeout_seconds=60)
+
+    for _ in range(2):
+        circuit_breaker.record_failure(HOST)
+    circuit_breaker.before_call(HOST) # Still closed
+    circuit_breaker.record_failure(HOST)
+
+    assert circuit_breaker.is_open(HOST)
+    with pytest.raises(CircuitOpenError):
+        circuit_breaker.before_call(HOST)
+    circuit_breaker.before_call('other.example.com') # Circuits are kept per host
+
+
+def test_half_open_circuit_lets_a_single_trial_through_and_closes_on_success(clock):
+    circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout_seconds=60)
+    circuit_breaker.record_failure(HOST)
+
+    clock.now += 61
+    circuit_breaker.before_call(HOST) # Trial call
+    with pytest.raises(CircuitOpenError):
+        circuit_breaker.before_call(HOST) # Other calls wait for the trial
+    circuit_breaker.record_success(HOST)
+
+    assert not circuit_breaker.is_open(HOST)
+    circuit_breaker.before_call(HOST)
+
+
+def test_failed_trial_opens_the_circuit_again(clock):
+    circuit_breaker = CircuitBreaker(failure_threshold=3, reset_timeout_seconds=60)
+    for _ in range(3):
+        circuit_breaker.record_failure(HOST)
+
+    clock.now += 61
+    circuit_breaker.before_call(HOST)
+    circuit_breaker.record_failure(HOST)
+
+    assert circuit_breaker.is_open(HOST)
+    with pytest.raises(CircuitOpenError):
+        circuit_breaker.before_call(HOST) # The reset timeout starts over
+    clock.now += 61
+    circuit_breaker.before_call(HOST)
+
+
+def test_policy_trips_the_circuit_only_on_server_errors(clock):
+    policy = BackoffRetryPolicy(circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout_seconds=60))
+
+    policy.record_failure(HOST, create_http_error(500))
+    policy.record_failure(HOST, create_http_error(404)) # The host answered, the failure count restarts
+    policy.record_failure(HOST, create_http_error(500))
+    with pytest.raises(CircuitOpenError):
+        policy.record_failure(HOST, create_http_error(503))
+    with pytest.raises(CircuitOpenError):
+        policy.before_attempt(HOST)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/python
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('arcpy') # core._logs reports through arcpy
+
+from core.libs.SceneCatalog import SceneCatalog, SceneRecord
+
+AREA = 'POLYGON ((-47 -15, -46 -15, -46 -16, -47 -16, -47 -15))'
+
+
+@pytest.fixture
+def catalog(tmp_path) -> SceneCatalog:
+    return SceneCatalog(path=str(tmp_path/'Scene_Catalog.sqlite'), ingestion_lag_days=3)
+
+
+def get_missing_ranges(catalog: SceneCatalog, begin_date: datetime, end_date: datetime, tiles: list = None, area: str = AREA, max_cloud_coverage: float = 20) -> list:
+    return catalog.get_missing_ranges(sensor='Sentinel2', tiles=tiles if tiles else ['22KFA'], area=area, begin_date=begin_date, end_date=end_date, max_cloud_coverage=max_cloud_coverage)
+
+
+def add_coverage(catalog: SceneCatalog, begin_date: datetime, end_date: datetime, tiles: list = None, area: str = AREA, max_cloud_coverage: float = 20) -> None:
+    catalog.add_coverage(sensor='Sentinel2', tiles=tiles if tiles else ['22KFA'], area=area, begin_date=begin_date, end_date=end_date, max_cloud_coverage=max_cloud_coverage)
+
+
+def create_record(scene_id: str, acquisition_date: datetime, nodata_pixel_percentage: float = None, cloud_cover: float = 10) -> SceneRecord:
+    title = f'S2B_MSIL2A_{acquisition_date:%Y%m%dT%H%M%S}_N0509_R010_T22KFA_{acquisition_date:%Y%m%dT%H%M%S}'
+    return SceneRecord(
+        scene_id=scene_id,
+        tile='22KFA',
+        datetime=acquisition_date,
+        feature={'geometry': None, 'properties': {'title': title, 'filename': f'{title}.SAFE'}},
+        title=title,
+        filename=f'{title}.SAFE',
+        cloud_cover=cloud_cover,
+        nodata_pixel_percentage=nodata_pixel_percentage
+    )
+
+
+def test_covered_ranges_are_subtracted_from_the_search(catalog):
+    add_coverage(catalog, datetime(2025, 1, 10), datetime(2025, 1, 20))
+    add_coverage(catalog, datetime(2025, 1, 15), datetime(2025, 2, 1)) # Overlapping ranges are merged
+    add_coverage(catalog, datetime(2025, 3, 1), datetime(2025, 3, 10))
+
+    assert get_missing_ranges(catalog, datetime(2025, 1, 1), datetime(2025, 4, 1)) == [
+        (datetime(2025, 1, 1), datetime(2025, 1, 10)),
+        (datetime(2025, 2, 1), datetime(2025, 3, 1)),
+        (datetime(2025, 3, 10), datetime(2025, 4, 1))
+    ]
+    assert get_missing_ranges(catalog, datetime(2025, 1, 12), datetime(2025, 1, 30)) == []
+
+
+def test_missing_ranges_are_merged_across_tiles(catalog):
+    add_coverage(catalog, datetime(2025, 1, 1), datetime(2025, 2, 1), tiles=['22KFA'])
+    add_coverage(catalog, datetime(2025, 1, 15), datetime(2025, 3, 1), tiles=['22KGA'])
+
+    assert get_missing_ranges(catalog, datetime(2025, 1, 1), datetime(2025, 3, 1), tiles=['22KFA', '22KGA']) == [
+        (datetime(2025, 1, 1), datetime(2025, 1, 15)), # Still missing for 22KGA
+        (datetime(2025, 2, 1), datetime(2025, 3, 1)) # Still missing for 22KFA
+    ]
+
+
+def test_coverage_of_other_areas_or_stricter_filters_doesnt_count(catalog):
+    add_coverage(catalog, datetime(2025, 1, 1), datetime(2025, 2, 1), max_cloud_coverage=10)
+    add_coverage(catalog, datetime(2025, 1, 1), datetime(2025, 2, 1), area='POLYGON ((0 0, 1 0, 1 1, 0 0))')
+
+    assert get_missing_ranges(catalog, datetime(2025, 1, 1), datetime(2025, 2, 1), max_cloud_coverage=20) == [
+        (datetime(2025, 1, 1), datetime(2025, 2, 1))
+    ]
+    assert get_missing_ranges(catalog, datetime(2025, 1, 1), datetime(2025, 2, 1), max_cloud_coverage=5) == []
+
+
+def test_days_within_the_ingestion_lag_are_never_covered(catalog):
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    before_coverage = datetime.now().replace(microsecond=0)
+    add_coverage(catalog, today - timedelta(days=30), today + timedelta(days=1))
+
+    missing_ranges = get_missing_ranges(catalog, today - timedelta(days=30), today + timedelta(days=1))
+
+    assert len(missing_ranges) == 1
+    lag_begin, lag_end = missing_ranges[0]
+    assert before_coverage - timedelta(days=3) <= lag_begin <= datetime.now() - timedelta(days=3)
+    assert lag_end == today + timedelta(days=1)
+
+
+def test_ranges_entirely_within_the_ingestion_lag_arent_recorded(catalog):
+    today = datetime.now()
+    add_coverage(catalog, today - timedelta(days=1), today)
+
+    assert get_missing_ranges(catalog, today - timedelta(days=1), today) == [(today - timedelta(days=1), today)]
+
+
+def test_upsert_keeps_the_stored_nodata_percentage(catalog):
+    acquisition_date = datetime(2025, 1, 5, 13, 27, 9)
+    catalog.put_scenes(sensor='Sentinel2', scenes=[create_record('a', acquisition_date)])
+    catalog.set_nodata_pixel_percentages(sensor='Sentinel2', nodata_pixel_percentages={'a': 12.5})
+
+    catalog.put_scenes(sensor='Sentinel2', scenes=[create_record('a', acquisition_date, cloud_cover=15)])
+
+    [record] = catalog.get_scenes(sensor='Sentinel2', tiles=['22KFA'], begin_date=datetime(2025, 1, 1), end_date=datetime(2025, 2, 1))
+    assert record.nodata_pixel_percentage == 12.5
+    assert record.cloud_cover == 15
+
+
+def test_scenes_are_filtered_by_date_and_cloud_cover(catalog):
+    catalog.put_scenes(sensor='Sentinel2', scenes=[
+        create_record('a', datetime(2025, 1, 5), cloud_cover=10),
+        create_record('b', datetime(2025, 1, 6), cloud_cover=40),
+        create_record('c', datetime(2025, 2, 5), cloud_cover=10)
+    ])
+
+    records = catalog.get_scenes(sensor='Sentinel2', tiles=['22KFA'], begin_date=datetime(2025, 1, 1), end_date=datetime(2025, 2, 1), max_cloud_coverage=20)
+
+    assert [record.scene_id for record in records] == ['a']
+
+
+def test_scenes_catalogued_before_the_title_column_read_it_from_the_feature(catalog):
+    acquisition_date = datetime(2025, 1, 5, 13, 27, 9)
+    record = create_record('a', acquisition_date)
+    catalog.put_scenes(sensor='Sentinel2', scenes=[record])
+    with sqlite3.connect(catalog.path) as connection:
+        connection.execute('UPDATE scenes SET title = NULL, filename = NULL')
+    connection.close()
+
+    [stored_record] = catalog.get_scenes(sensor='Sentinel2', tiles=['22KFA'], begin_date=datetime(2025, 1, 1), end_date=datetime(2025, 2, 1))
+
+    assert stored_record.title == record.title
+    assert stored_record.filename == record.filename